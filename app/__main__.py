@@ -0,0 +1,40 @@
+"""Production entry point: `python -m app`.
+
+Runs WEB_CONCURRENCY uvicorn worker processes (default: 1) on one shared
+socket. The schema is migrated here, once, before any worker starts; inside
+the workers a lease in stations.db (app/leader.py) picks the one that
+ingests, and the rest pick up its writes through the stations version. For
+development with auto-reload, run `python -m app.main`.
+
+Everything else in memory is per worker: stream hubs (two listeners of one
+station on different workers mean two upstreams), now-playing titles and
+their SSE feed (only the worker owning the hub sees them), /api/prewarm
+connections, the SoundCloud resolver cache and /api/metrics counters. Raise
+WEB_CONCURRENCY only behind a balancer that pins a station to one worker,
+or when that duplication is acceptable.
+"""
+import os
+
+import uvicorn
+
+from app.database import close_db, init_db
+from app.log import configure_logging
+
+
+def main():
+    configure_logging()
+    init_db()
+    close_db()
+    uvicorn.run(
+        "app.main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        # Proxy streams are long-lived; don't let a restart hang on them forever
+        timeout_graceful_shutdown=10,
+        proxy_headers=True,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+
+from app.metrics import UPSTREAM_ERRORS, UPSTREAM_TTFB
+
+log = logging.getLogger("app.proxy")
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+# Share-link noise that doesn't change which stream is served
+_TRACKING_PARAMS = {"si", "feature", "fbclid", "gclid"}
+
+
+def normalize_stream_url(url: str) -> str:
+    """Canonical hub key for a stream URL.
+
+    Lower-cases scheme/host, drops default ports, fragments and share-tracking
+    query params, and folds the YouTube URL variants onto a single watch URL,
+    so that every listener of the same station lands on the same hub.
+    """
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or "").lower()
+    port = parsed.port
+    query = [
+        (k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True)
+        if k not in _TRACKING_PARAMS and not k.startswith("utm_")
+    ]
+
+    # youtu.be/<id>, youtube.com/live/<id> and watch?v=<id> are the same stream
+    if host in ("youtu.be", "youtube.com", "www.youtube.com", "m.youtube.com"):
+        segments = [s for s in parsed.path.split("/") if s]
+        video_id = dict(query).get("v")
+        if host == "youtu.be" and segments:
+            video_id = segments[0]
+        elif len(segments) == 2 and segments[0] in ("live", "shorts", "embed"):
+            video_id = segments[1]
+        if video_id:
+            return f"https://www.youtube.com/watch?v={video_id}"
+
+    netloc = host if port in (None, _DEFAULT_PORTS.get(scheme)) else f"{host}:{port}"
+    return urlunparse((scheme, netloc, parsed.path or "/", "", urlencode(query), ""))
+
+
+class StreamHub:
+    """One upstream reader fanned out to many listeners.
+
+    The pump task drains the upstream generator into a byte-bounded ring of
+    chunks. Each listener walks the ring at its own cursor; a listener that
+    falls off the back of the ring skips ahead to near the live edge instead
+    of stalling the upstream or the other listeners.
+
+    A hub that isn't `live` (an on-demand track) has a single listener, who
+    starts at the first byte and never skips: the pump stops reading while
+    the ring is full, so a slow listener pauses the upstream instead.
+    """
+
+    RING_BYTES = 1024 * 1024   # upstream bytes retained for listeners to catch up on
+    JOIN_BACKLOG = 8           # chunks replayed to a new listener for a fast start
+    GRACE_SECONDS = 10.0       # keep the upstream alive this long after the last listener leaves
+
+    def __init__(self, key: str, kind: str, media_type: str, source: AsyncIterator[bytes],
+                 on_close: Callable[["StreamHub"], None], live: bool = True):
+        self.key = key
+        self.kind = kind          # upstream reader: "tcp", "soundcloud" or "youtube"
+        self.media_type = media_type
+        self.live = live
+        self.listeners = 0
+        self.bytes_in = 0
+        self.dropped = 0          # chunks skipped by listeners that fell behind the ring
+        self.closed = False
+
+        self._source = source
+        self._on_close = on_close
+        self._chunks: deque = deque()
+        self._buffered = 0        # bytes currently held in _chunks
+        self._head = 0            # sequence number of the next chunk to arrive
+        self._wake = asyncio.Event()
+        self._drained = asyncio.Event()     # on-demand: the listener has consumed chunks
+        self._close_handle: Optional[asyncio.TimerHandle] = None
+
+        self._task = asyncio.get_running_loop().create_task(self._pump())
+        # If the first listener never starts reading, the grace timer still reaps us
+        self._schedule_close()
+
+    async def _pump(self):
+        opened = time.monotonic()
+        try:
+            async for chunk in self._source:
+                if not self._head:
+                    UPSTREAM_TTFB.labels(self.kind).observe(time.monotonic() - opened)
+                self._chunks.append(chunk)
+                self._buffered += len(chunk)
+                self._head += 1
+                self.bytes_in += len(chunk)
+                if self.live:
+                    while self._buffered > self.RING_BYTES and len(self._chunks) > 1:
+                        self._buffered -= len(self._chunks.popleft())
+                self._notify()
+                while not self.live and self._buffered > self.RING_BYTES:
+                    # Backpressure: the listener frees the ring as it reads
+                    self._drained.clear()
+                    await self._drained.wait()
+        except Exception as e:
+            UPSTREAM_ERRORS.labels(self.kind, type(e).__name__).inc()
+            log.warning("Hub upstream error (%.80s): %s", self.key, e)
+        finally:
+            self.closed = True
+            self._notify()
+            self._on_close(self)
+            aclose = getattr(self._source, "aclose", None)
+            if aclose:
+                await aclose()
+
+    def _notify(self):
+        self._wake.set()
+        self._wake = asyncio.Event()
+
+    async def listen(self) -> AsyncIterator[bytes]:
+        """Async generator of chunks for one listener, starting near the live edge (or at the start, on demand)."""
+        self._attach()
+        try:
+            cursor = self._head - len(self._chunks)
+            if self.live:
+                cursor = max(cursor, self._head - self.JOIN_BACKLOG)
+            while True:
+                base = self._head - len(self._chunks)
+                if cursor < base:
+                    # Fell off the back of the ring — jump forward rather than lag forever
+                    skip_to = max(base, self._head - self.JOIN_BACKLOG)
+                    self.dropped += skip_to - cursor
+                    cursor = skip_to
+                if cursor < self._head:
+                    chunk = self._chunks[cursor - base]
+                    cursor += 1
+                    if not self.live:
+                        # Sole listener: what it has read is never needed again
+                        self._buffered -= len(self._chunks.popleft())
+                        self._drained.set()
+                    yield chunk
+                elif self.closed:
+                    return
+                else:
+                    await self._wake.wait()
+        finally:
+            self._detach()
+
+    def _attach(self):
+        self.listeners += 1
+        if self._close_handle:
+            self._close_handle.cancel()
+            self._close_handle = None
+
+    def _detach(self):
+        self.listeners -= 1
+        if self.listeners == 0:
+            if self.live:
+                self._schedule_close()
+            else:
+                # Nobody else can attach to an on-demand hub
+                self._task.cancel()
+
+    def _schedule_close(self):
+        if self._close_handle is None and not self.closed:
+            loop = asyncio.get_running_loop()
+            self._close_handle = loop.call_later(self.GRACE_SECONDS, self._close_if_idle)
+
+    def _close_if_idle(self):
+        self._close_handle = None
+        if self.listeners == 0:
+            log.debug("Hub idle, closing upstream: %.80s", self.key)
+            self._task.cancel()
+
+    def stats(self) -> Dict:
+        return {
+            "url": self.key,
+            "kind": self.kind,
+            "live": self.live,
+            "media_type": self.media_type,
+            "listeners": self.listeners,
+            "bytes_in": self.bytes_in,
+            "buffered_bytes": self._buffered,
+            "dropped_chunks": self.dropped,
+        }
+
+
+class HubRegistry:
+    """Live StreamHubs keyed by normalized stream URL, plus on-demand hubs that are never shared."""
+
+    def __init__(self):
+        self._hubs: Dict[str, StreamHub] = {}
+        self._on_demand: Set[StreamHub] = set()     # one per listener, so not keyed
+        self._closed_bytes: Dict[str, int] = {}     # kind -> bytes_in of hubs already gone
+
+    def get(self, key: str) -> Optional[StreamHub]:
+        hub = self._hubs.get(key)
+        return hub if hub and not hub.closed else None
+
+    def create(self, key: str, kind: str, media_type: str, source: AsyncIterator[bytes],
+               live: bool = True) -> StreamHub:
+        """A new hub reading `source`; only `live` hubs are handed to later listeners by get()."""
+        hub = StreamHub(key, kind, media_type, source, on_close=self._remove, live=live)
+        if live:
+            self._hubs[key] = hub
+        else:
+            self._on_demand.add(hub)
+        return hub
+
+    def _remove(self, hub: StreamHub):
+        self._closed_bytes[hub.kind] = self._closed_bytes.get(hub.kind, 0) + hub.bytes_in
+        self._on_demand.discard(hub)
+        if self._hubs.get(hub.key) is hub:
+            del self._hubs[hub.key]
+
+    def _all(self) -> List[StreamHub]:
+        return [*self._hubs.values(), *self._on_demand]
+
+    def totals(self) -> Dict[str, Dict[str, int]]:
+        """Per upstream kind: open hubs, their listeners, and upstream bytes ever received."""
+        totals = {kind: {"streams": 0, "listeners": 0, "bytes_in": n} for kind, n in self._closed_bytes.items()}
+        for hub in self._all():
+            entry = totals.setdefault(hub.kind, {"streams": 0, "listeners": 0, "bytes_in": 0})
+            entry["bytes_in"] += hub.bytes_in
+            if not hub.closed:
+                entry["streams"] += 1
+                entry["listeners"] += hub.listeners
+        return totals
+
+    def stats(self) -> List[Dict]:
+        return [hub.stats() for hub in self._all()]
+
+
+hubs = HubRegistry()
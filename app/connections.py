@@ -0,0 +1,185 @@
+import asyncio
+import os
+import socket
+import ssl
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# getaddrinfo doesn't report record TTLs, so answers are kept this long
+DNS_CACHE_TTL = float(os.getenv("DNS_CACHE_TTL", "300"))
+# Failed lookups are remembered briefly, so a dead host isn't re-queried per click
+DNS_NEGATIVE_TTL = 30.0
+DNS_CACHE_SIZE = 2048
+# Connections kept open per host by the shared HTTP client
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+
+
+class DnsCache:
+    """Async getaddrinfo with a TTL cache and single-flight lookups.
+
+    Used for every raw upstream connection (proxy, pre-connect and health
+    probes), so a station's host is resolved once per DNS_CACHE_TTL rather
+    than on every tune-in. `forget()` drops an entry whose addresses all
+    refused a connection.
+    """
+
+    def __init__(self, ttl: float = DNS_CACHE_TTL, negative_ttl: float = DNS_NEGATIVE_TTL,
+                 max_entries: int = DNS_CACHE_SIZE):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        # (host, port) -> (addresses or the lookup error, expires_at)
+        self._entries: "OrderedDict[Tuple[str, int], tuple]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, int], asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def resolve(self, host: str, port: int) -> List[Tuple[int, str]]:
+        """(family, address) pairs for host:port, in getaddrinfo's order."""
+        key = (host, port)
+        entry = self._entries.get(key)
+        if entry and entry[1] > time.monotonic():
+            self.hits += 1
+            self._entries.move_to_end(key)
+            if isinstance(entry[0], OSError):
+                raise entry[0]
+            return entry[0]
+        self.misses += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._lookup(host, port))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _lookup(self, host: str, port: int) -> List[Tuple[int, str]]:
+        key = (host, port)
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        except OSError as e:
+            self._store(key, e, self.negative_ttl)
+            raise
+        addresses = list(dict.fromkeys((family, sockaddr[0]) for family, _, _, _, sockaddr in infos))
+        self._store(key, addresses, self.ttl)
+        return addresses
+
+    def _store(self, key: Tuple[str, int], value, ttl: float):
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def forget(self, host: str, port: int):
+        self._entries.pop((host, port), None)
+
+    def stats(self) -> Dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class ResumingTLSContext(ssl.SSLContext):
+    """A client SSLContext that offers each host its last TLS session back.
+
+    asyncio's open_connection has no `session=` argument, but every TLS
+    connection it makes goes through `wrap_bio`, so that is where the saved
+    session for `server_hostname` is passed in. A resumed handshake skips
+    the certificate exchange and, on TLS 1.2, a round trip.
+    """
+
+    MAX_SESSIONS = 512
+
+    def __new__(cls):
+        return super().__new__(cls, ssl.PROTOCOL_TLS_CLIENT)
+
+    def __init__(self):
+        self.load_default_certs()
+        self.sessions: "OrderedDict[str, ssl.SSLSession]" = OrderedDict()
+        self.resumed = 0
+        self.full = 0
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        if session is None and not server_side:
+            session = self.sessions.get(server_hostname)
+        return super().wrap_bio(incoming, outgoing, server_side=server_side,
+                                server_hostname=server_hostname, session=session)
+
+    def remember(self, ssl_object: Optional[ssl.SSLObject]):
+        """Keep a finished connection's session for the next one to its host.
+
+        Call once some response has been read: TLS 1.3 servers send their
+        session tickets after the handshake.
+        """
+        if ssl_object is None: return
+        if ssl_object.session_reused:
+            self.resumed += 1
+        else:
+            self.full += 1
+        session = ssl_object.session
+        if session is not None and ssl_object.server_hostname:
+            self.sessions[ssl_object.server_hostname] = session
+            self.sessions.move_to_end(ssl_object.server_hostname)
+            while len(self.sessions) > self.MAX_SESSIONS:
+                self.sessions.popitem(last=False)
+
+    def stats(self) -> Dict:
+        return {"sessions": len(self.sessions), "resumed": self.resumed, "full_handshakes": self.full}
+
+
+dns_cache = DnsCache()
+# Loading the CA bundle costs milliseconds per context: build it once
+tls_context = ResumingTLSContext()
+
+
+async def open_connection(host: str, port: int, tls: bool):
+    """asyncio.open_connection through the DNS cache and the shared TLS context.
+
+    The cached addresses are tried in order; if none accepts, the entry is
+    dropped so the next attempt resolves afresh.
+    """
+    addresses = await dns_cache.resolve(host, port)
+    error: Optional[OSError] = None
+    for family, address in addresses:
+        try:
+            return await asyncio.open_connection(
+                address, port, family=family,
+                ssl=tls_context if tls else None,
+                server_hostname=host if tls else None,
+            )
+        except ssl.SSLError:
+            raise           # the host answered; another address won't fix its certificate
+        except OSError as e:
+            error = e
+    dns_cache.forget(host, port)
+    raise error or OSError(f"no addresses for {host}")
+
+
+_http_client = None
+_http_client_loop = None
+
+
+def http_client():
+    """The process-wide pooled httpx.AsyncClient (SoundCloud CDN, parsers).
+
+    Keep-alive connections, and the DNS and TLS work behind them, are
+    reused across requests instead of thrown away with a client per call. httpx is imported
+    on first use. A client is tied to its event loop, so a new loop (a
+    one-off asyncio.run) gets a new client.
+    """
+    global _http_client, _http_client_loop
+    import httpx    # deferred: keeps the app's import time down
+    loop = asyncio.get_running_loop()
+    if _http_client is None or _http_client.is_closed or _http_client_loop is not loop:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_keepalive_connections=HTTP_MAX_KEEPALIVE, keepalive_expiry=60.0),
+            timeout=httpx.Timeout(10.0),
+            headers={"User-Agent": "MidnightRadio/1.0"},
+        )
+        _http_client_loop = loop
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None and _http_client_loop is asyncio.get_running_loop():
+        await _http_client.aclose()
+    _http_client = None
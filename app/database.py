@@ -1,55 +1,921 @@
-import sqlite_utils
+import hashlib
+import json
+import logging
 import os
-from typing import List, Dict
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Tuple
+
+from app.metrics import DB_WRITE_SECONDS
+
+log = logging.getLogger(__name__)
 
 # Preferred path (Umbrel volume)
 # Ultimate fallback to /tmp/ which is guaranteed writable in Docker
 DB_PATH = os.getenv("DATABASE_PATH", "/data/stations.db")
 FALLBACK_PATH = "/tmp/stations.db"
+# Last resort: shared-cache URI so every connection sees the same in-memory DB
+MEMORY_URI = "file:geo-radio?mode=memory&cache=shared"
+
+STATION_COLUMNS = ("uuid", "name", "url", "country", "tags", "lat", "lng", "source")
+# The full record adds the failover URLs of collapsed duplicates (a JSON list)
+RECORD_COLUMNS = STATION_COLUMNS + ("alt_urls",)
+# Written by ingestion for app/normalize.py, never listed: the duplicate keys,
+# the grid cell and the position before co-located stations were spread
+DEDUPE_COLUMNS = ("url_key", "place_key", "cell", "raw_lat", "raw_lng")
+INGESTED_COLUMNS = RECORD_COLUMNS + DEDUPE_COLUMNS
+
+# Stations whose probe health score (app/health.py) has decayed below this are
+# hidden from every listing. Never-probed stations count as healthy.
+HEALTH_HIDE_BELOW = 0.25
+
+# Applied to every connection. mmap + a larger page cache keep the hot read
+# path out of syscalls; busy_timeout covers the brief WAL checkpoint locks.
+_CONNECTION_PRAGMAS = (
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+# Writer only. WAL lets the per-thread readers run while ingestion writes;
+# synchronous=NORMAL is durable across app crashes, only an OS crash can
+# lose the last commits — acceptable for a re-fetchable station cache.
+_WRITER_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+)
+
+_write_conn: Optional[sqlite3.Connection] = None
+_write_lock = threading.Lock()
+_init_lock = threading.Lock()
+_target: Tuple[str, bool] = (DB_PATH, False)     # (database, is_uri) chosen by init_db
+_local = threading.local()
+_readers: List[sqlite3.Connection] = []
+_stations_version = 0      # in-memory mirror of meta.stations_version
+
+
+# ── MIGRATIONS ───────────────────────────────────────────────────────────────
+# Schema changes live here, never in the write path. Each step runs once, in
+# order, inside a transaction; PRAGMA user_version records how far we got.
+
+def _migrate_stations_table(conn: sqlite3.Connection):
+    # Databases from before this layer were created by sqlite-utils with
+    # uuid as a TEXT primary key. Rebuild with an explicit INTEGER PRIMARY KEY
+    # so rowids stay stable for anything that references them.
+    legacy = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stations'"
+    ).fetchone()
+    if legacy:
+        conn.execute("ALTER TABLE stations RENAME TO stations_legacy")
+    conn.execute("""
+        CREATE TABLE stations (
+            id      INTEGER PRIMARY KEY,
+            uuid    TEXT NOT NULL UNIQUE,
+            name    TEXT,
+            url     TEXT,
+            country TEXT,
+            tags    TEXT,
+            lat     REAL,
+            lng     REAL,
+            source  TEXT
+        )
+    """)
+    if legacy:
+        existing = {row["name"] for row in conn.execute("PRAGMA table_info(stations_legacy)")}
+        cols = ", ".join(c for c in STATION_COLUMNS if c in existing)
+        conn.execute(
+            f"INSERT OR IGNORE INTO stations ({cols}) "
+            f"SELECT {cols} FROM stations_legacy WHERE uuid IS NOT NULL"
+        )
+        conn.execute("DROP TABLE stations_legacy")
+    conn.execute("DROP TABLE IF EXISTS _test")
+
+
+def _migrate_station_indexes(conn: sqlite3.Connection):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_stations_source ON stations(source)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_stations_country ON stations(country)")
+    # Only geo-valid rows are ever served to the globe
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_stations_geo ON stations(lat, lng)
+        WHERE lat IS NOT NULL AND lng IS NOT NULL
+    """)
+
+
+def _migrate_meta_table(conn: sqlite3.Connection):
+    # stations_version is bumped by every write that actually changes a row;
+    # cached payloads compare against it to know when to rebuild
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('stations_version', 0)")
+
+
+def _migrate_spatial_index(conn: sqlite3.Connection):
+    # R*Tree over station points, keyed by stations.id and kept in step by
+    # triggers, so viewport queries never scan the whole table
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS stations_rtree
+        USING rtree(id, min_lat, max_lat, min_lng, max_lng)
+    """)
+    conn.execute("""
+        INSERT INTO stations_rtree
+        SELECT id, lat, lat, lng, lng FROM stations
+        WHERE lat IS NOT NULL AND lng IS NOT NULL
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS stations_rtree_ai AFTER INSERT ON stations
+        WHEN new.lat IS NOT NULL AND new.lng IS NOT NULL
+        BEGIN
+            INSERT INTO stations_rtree VALUES (new.id, new.lat, new.lat, new.lng, new.lng);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS stations_rtree_au AFTER UPDATE OF lat, lng ON stations
+        BEGIN
+            DELETE FROM stations_rtree WHERE id = old.id;
+            INSERT INTO stations_rtree
+            SELECT new.id, new.lat, new.lat, new.lng, new.lng
+            WHERE new.lat IS NOT NULL AND new.lng IS NOT NULL;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS stations_rtree_ad AFTER DELETE ON stations
+        BEGIN
+            DELETE FROM stations_rtree WHERE id = old.id;
+        END
+    """)
+
+
+def _migrate_search_index(conn: sqlite3.Connection):
+    # External-content FTS5 mirror of the searchable columns. Triggers keep it
+    # current, and prefix indexes make 2-3 character type-ahead cheap.
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS stations_fts USING fts5(
+            name, tags, country,
+            content = 'stations', content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    """)
+    conn.execute("INSERT INTO stations_fts(stations_fts) VALUES ('rebuild')")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS stations_fts_ai AFTER INSERT ON stations
+        BEGIN
+            INSERT INTO stations_fts(rowid, name, tags, country)
+            VALUES (new.id, new.name, new.tags, new.country);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS stations_fts_au AFTER UPDATE OF name, tags, country ON stations
+        BEGIN
+            INSERT INTO stations_fts(stations_fts, rowid, name, tags, country)
+            VALUES ('delete', old.id, old.name, old.tags, old.country);
+            INSERT INTO stations_fts(rowid, name, tags, country)
+            VALUES (new.id, new.name, new.tags, new.country);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS stations_fts_ad AFTER DELETE ON stations
+        BEGIN
+            INSERT INTO stations_fts(stations_fts, rowid, name, tags, country)
+            VALUES ('delete', old.id, old.name, old.tags, old.country);
+        END
+    """)
+
+
+def _migrate_ingestion_runs(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ingestion_runs (
+            id          INTEGER PRIMARY KEY,
+            started_at  REAL NOT NULL,
+            finished_at REAL NOT NULL,
+            report      TEXT NOT NULL
+        )
+    """)
+
+
+def _migrate_content_hash(conn: sqlite3.Connection):
+    # Digest of a row's ingested columns; a re-ingested row whose digest is
+    # unchanged is skipped by the upsert without touching any pages
+    conn.execute("ALTER TABLE stations ADD COLUMN content_hash TEXT")
+
+
+def _migrate_refresh_state(conn: sqlite3.Connection):
+    # Per-source bookkeeping for the refresh scheduler, and HTTP validators
+    # (ETag / Last-Modified) so unchanged upstream pages cost a 304
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS source_refreshes (
+            source      TEXT PRIMARY KEY,
+            last_run_at REAL NOT NULL,
+            status      TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS http_validators (
+            url           TEXT PRIMARY KEY,
+            etag          TEXT,
+            last_modified TEXT,
+            rows          INTEGER,
+            updated_at    REAL NOT NULL
+        )
+    """)
+
+
+def _migrate_probe_health(conn: sqlite3.Connection):
+    # Results of the background stream prober. `health` is a decayed score in
+    # [0, 1]; NULL means never probed and is treated as healthy.
+    for column in (
+        "health REAL",
+        "probe_at REAL",
+        "probe_connect_ms REAL",
+        "probe_ttfb_ms REAL",
+        "probe_status INTEGER",
+        "probe_content_type TEXT",
+        "probe_failures INTEGER NOT NULL DEFAULT 0",
+    ):
+        conn.execute(f"ALTER TABLE stations ADD COLUMN {column}")
+    # Oldest-probe-first scans for the prober; NULLs (never probed) sort first
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_stations_probe_at ON stations(probe_at)")
+    # Healthiest-first listing without a sort step
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_stations_health ON stations(COALESCE(health, 1.0))
+        WHERE lat IS NOT NULL AND lng IS NOT NULL
+    """)
+
+
+def _migrate_worker_coordination(conn: sqlite3.Connection):
+    # Multi-worker mode (app/leader.py): a time-limited lease names the one
+    # process that ingests, and other workers queue /api/refresh calls for it
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS leases (
+            name       TEXT PRIMARY KEY,
+            holder     TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS refresh_requests (
+            source       TEXT PRIMARY KEY,    -- '' for every source
+            requested_at REAL NOT NULL
+        )
+    """)
+
+
+def _migrate_alternate_urls(conn: sqlite3.Connection):
+    conn.execute("ALTER TABLE stations ADD COLUMN alt_urls TEXT")
+    # The proxy looks up a stream's alternates by the URL it was asked for
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_stations_url ON stations(url)")
+
+
+def _migrate_dedupe_keys(conn: sqlite3.Connection):
+    for column, kind in (("url_key", "TEXT"), ("place_key", "TEXT"), ("cell", "INTEGER"),
+                         ("raw_lat", "REAL"), ("raw_lng", "REAL")):
+        conn.execute(f"ALTER TABLE stations ADD COLUMN {column} {kind}")
+    # Duplicates are looked up per source, batch by batch, as ingestion writes
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_stations_url_key ON stations(source, url_key)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_stations_place_key ON stations(source, place_key)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_stations_cell ON stations(cell)")
+    # Existing rows get their keys on the next refresh: make it rewrite
+    # every row, unchanged pages included, once
+    conn.execute("UPDATE stations SET content_hash = NULL")
+    conn.execute("DELETE FROM http_validators")
+
+
+_MIGRATIONS = (
+    _migrate_stations_table,
+    _migrate_station_indexes,
+    _migrate_meta_table,
+    _migrate_spatial_index,
+    _migrate_search_index,
+    _migrate_ingestion_runs,
+    _migrate_content_hash,
+    _migrate_refresh_state,
+    _migrate_probe_health,
+    _migrate_worker_coordination,
+    _migrate_alternate_urls,
+    _migrate_dedupe_keys,
+)
+
+
+def _migrate(conn: sqlite3.Connection):
+    # The version is re-read inside each step's write transaction, so several
+    # worker processes starting at once apply every step exactly once
+    while True:
+        with _transaction(conn):
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= len(_MIGRATIONS):
+                return
+            migration = _MIGRATIONS[version]
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+        log.info("Applied migration %d: %s", version + 1, migration.__name__)
+
+
+# ── CONNECTIONS ──────────────────────────────────────────────────────────────
+
+def _connect(database: str, uri: bool) -> sqlite3.Connection:
+    # isolation_level=None: no implicit transactions, we BEGIN explicitly
+    conn = sqlite3.connect(database, uri=uri, check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    for pragma in _CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+@contextmanager
+def _transaction(conn: sqlite3.Connection):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _open_writer(database: str, uri: bool) -> sqlite3.Connection:
+    conn = _connect(database, uri)
+    for pragma in _WRITER_PRAGMAS:
+        conn.execute(pragma)
+    _migrate(conn)
+    _load_stations_version(conn)
+    return conn
+
+
+def _load_stations_version(conn: sqlite3.Connection):
+    global _stations_version
+    row = conn.execute("SELECT value FROM meta WHERE key = 'stations_version'").fetchone()
+    _stations_version = row[0] if row else 0
+
+
+def stations_version() -> int:
+    """Version of the stations table as of this process's last write or reload. No I/O."""
+    init_db()
+    return _stations_version
+
+
+def reload_stations_version() -> bool:
+    """Pick up writes made by other processes. Returns True if the version moved."""
+    global _stations_version
+    try:
+        row = _reader().execute("SELECT value FROM meta WHERE key = 'stations_version'").fetchone()
+    except Exception as e:
+        log.error("Read error: %s", e)
+        return False
+    if row is None or row[0] == _stations_version:
+        return False
+    _stations_version = row[0]
+    return True
+
+
+def init_db():
+    """Open the long-lived writer connection and bring the schema up to date.
+
+    Safe to call repeatedly; only the first call does any work.
+    """
+    global DB_PATH, _write_conn, _target
+    with _init_lock:
+        if _write_conn is not None:
+            return
+
+        # 1. Try Primary Path
+        try:
+            db_dir = os.path.dirname(DB_PATH)
+            if db_dir and not os.path.exists(db_dir):
+                os.makedirs(db_dir, exist_ok=True)
+            _write_conn, _target = _open_writer(DB_PATH, False), (DB_PATH, False)
+            log.info("Database ready at %s", DB_PATH)
+            return
+        except Exception as e:
+            log.warning("Primary storage (%s) failed: %s", DB_PATH, e)
 
-def get_db():
-    global DB_PATH
-    
-    # 1. Try Primary Path
-    try:
-        db_dir = os.path.dirname(DB_PATH)
-        if db_dir and not os.path.exists(db_dir):
-            os.makedirs(db_dir, exist_ok=True)
-        
-        db = sqlite_utils.Database(DB_PATH)
-        # Test if writable
-        db.execute("CREATE TABLE IF NOT EXISTS _test (id INTEGER PRIMARY KEY)")
-        return db
-    except Exception as e:
-        print(f"⚠️ Primary storage (/data) failed: {e}")
-        
         # 2. Try Fallback Path (Absolute path in /tmp)
         try:
-            print(f"🔄 Switching to absolute fallback: {FALLBACK_PATH}")
+            log.warning("Switching to absolute fallback: %s", FALLBACK_PATH)
             DB_PATH = FALLBACK_PATH
-            db = sqlite_utils.Database(DB_PATH)
-            return db
+            _write_conn, _target = _open_writer(DB_PATH, False), (DB_PATH, False)
+            return
         except Exception as e2:
-            print(f"❌ All file storage failed: {e2}")
-            # 3. Final resort: In-Memory (lost on restart, but app stays alive)
-            return sqlite_utils.Database(memory=True)
+            log.error("All file storage failed, using an in-memory database: %s", e2)
+
+        # 3. Final resort: In-Memory (lost on restart, but app stays alive)
+        _write_conn, _target = _open_writer(MEMORY_URI, True), (MEMORY_URI, True)
+
+
+def close_db():
+    global _write_conn
+    with _init_lock:
+        for conn in _readers:
+            conn.close()
+        _readers.clear()
+        _local.__dict__.clear()
+        if _write_conn is not None:
+            _write_conn.close()
+            _write_conn = None
+
+
+def _writer() -> sqlite3.Connection:
+    init_db()
+    return _write_conn
+
+
+def _reader() -> sqlite3.Connection:
+    """This thread's read-only connection; under WAL it never waits on the writer."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        init_db()
+        conn = _connect(*_target)
+        conn.execute("PRAGMA query_only=1")
+        _local.conn = conn
+        with _init_lock:
+            _readers.append(conn)
+    return conn
+
+
+# ── QUERIES ──────────────────────────────────────────────────────────────────
+# Constant SQL strings: sqlite3 keeps each one compiled in its per-connection
+# statement cache, so repeat calls only bind parameters.
+
+_UPSERT_SQL = f"""
+    INSERT INTO stations ({", ".join(INGESTED_COLUMNS)}, content_hash)
+    VALUES ({", ".join(":" + c for c in INGESTED_COLUMNS)}, :content_hash)
+    ON CONFLICT(uuid) DO UPDATE SET
+        {", ".join(f"{c} = excluded.{c}" for c in INGESTED_COLUMNS if c != "uuid")},
+        content_hash = excluded.content_hash
+    -- Unchanged rows are left alone: no page writes, no version bump
+    WHERE stations.content_hash IS NOT excluded.content_hash
+"""
+
+_BUMP_VERSION_SQL = "UPDATE meta SET value = value + 1 WHERE key = 'stations_version'"
+
+# Every listing leaves out stations the prober has found dead
+_VISIBLE = f"COALESCE(health, 1.0) >= {HEALTH_HIDE_BELOW}"
+
+_QUERY_STATIONS_SQL = f"""
+    SELECT {", ".join(STATION_COLUMNS)} FROM stations
+    WHERE lat IS NOT NULL AND lng IS NOT NULL AND {_VISIBLE}
+    ORDER BY COALESCE(health, 1.0) DESC
+    LIMIT ?
+"""
+
+
+_QUERY_BBOX_SQL = f"""
+    SELECT {", ".join("s." + c for c in STATION_COLUMNS)}
+    FROM stations_rtree r JOIN stations s ON s.id = r.id
+    WHERE r.max_lat >= :south AND r.min_lat <= :north
+      AND r.max_lng >= :west AND r.min_lng <= :east
+      AND COALESCE(s.health, 1.0) >= {HEALTH_HIDE_BELOW}
+    ORDER BY COALESCE(s.health, 1.0) DESC
+    LIMIT :limit
+"""
 
-def upsert_stations(stations: List[Dict]):
-    if not stations: return
+# bm25 column weights: a name hit outranks a tag hit outranks a country hit
+_SEARCH_SQL = f"""
+    SELECT {", ".join("s." + c for c in STATION_COLUMNS)}
+    FROM stations_fts JOIN stations s ON s.id = stations_fts.rowid
+    WHERE stations_fts MATCH :match
+      AND s.lat BETWEEN :south AND :north
+      AND (s.lng BETWEEN :west1 AND :east1 OR s.lng BETWEEN :west2 AND :east2)
+      AND COALESCE(s.health, 1.0) >= {HEALTH_HIDE_BELOW}
+    ORDER BY bm25(stations_fts, 10.0, 4.0, 2.0)
+    LIMIT :limit
+"""
+
+_GET_STATION_SQL = f"SELECT {', '.join(RECORD_COLUMNS)} FROM stations WHERE uuid = ?"
+
+_QUERY_POINTS_SQL = f"""
+    SELECT lat, lng, tags FROM stations
+    WHERE lat IS NOT NULL AND lng IS NOT NULL AND {_VISIBLE}
+"""
+
+_PROBE_CANDIDATES_SQL = """
+    SELECT id, url FROM stations
+    WHERE url IS NOT NULL AND lat IS NOT NULL AND lng IS NOT NULL
+      AND (probe_at IS NULL OR probe_at < ?)
+    ORDER BY probe_at
+    LIMIT ?
+"""
+
+# The score is an exponentially weighted average folded in here, so a
+# recording never needs a read first. A NULL sample (not probeable) only
+# moves probe_at forward.
+_RECORD_PROBE_SQL = """
+    UPDATE stations SET
+        health = CASE WHEN :sample IS NULL THEN health
+                      ELSE COALESCE(health, 1.0) * :decay + :sample * (1.0 - :decay) END,
+        probe_at = :probe_at,
+        probe_connect_ms = :connect_ms,
+        probe_ttfb_ms = :ttfb_ms,
+        probe_status = :status,
+        probe_content_type = :content_type,
+        probe_failures = CASE WHEN :sample IS NULL OR :sample > 0 THEN 0 ELSE probe_failures + 1 END
+    WHERE id = :id
+"""
+
+_VISIBLE_IDS_SQL = f"""
+    SELECT id FROM stations
+    WHERE id IN (SELECT value FROM json_each(?)) AND {_VISIBLE}
+"""
+
+
+def _content_hash(row: Dict) -> str:
+    # The dedupe columns are derived from these, so they needn't be hashed
+    return hashlib.blake2b(repr(tuple(row[c] for c in RECORD_COLUMNS)).encode(), digest_size=8).hexdigest()
+
+
+def upsert_stations(stations: List[Dict]) -> int:
+    """Insert or update stations by uuid, in one transaction.
+
+    Rows whose content hash matches the stored one are skipped. Returns how
+    many rows actually changed.
+    """
+    if not stations: return 0
+    rows = []
+    for s in stations:
+        if not s.get("uuid"): continue
+        row = {c: s.get(c) for c in INGESTED_COLUMNS}
+        row["content_hash"] = _content_hash(row)
+        rows.append(row)
     try:
-        db = get_db()
-        db["stations"].upsert_all(stations, pk="uuid", alter=True)
-        print(f"✅ Success: {len(stations)} stations saved to {DB_PATH}")
+        with DB_WRITE_SECONDS.labels("upsert_stations").time(), _write_lock:
+            with _transaction(_writer()) as conn:
+                # rowcount sums direct changes only, not the index triggers' writes
+                changed = conn.executemany(_UPSERT_SQL, rows).rowcount
+                if changed:
+                    conn.execute(_BUMP_VERSION_SQL)
+            if changed:
+                _load_stations_version(conn)
+        log.debug("%d stations saved to %s (%d changed)", len(rows), DB_PATH, changed)
+        return changed
     except Exception as e:
-        print(f"❌ Write Error: {e}")
+        log.error("Write error: %s", e)
+        return 0
+
+
+def delete_stations(uuids: List[str]) -> int:
+    """Delete stations by uuid, in one transaction. Returns how many existed."""
+    if not uuids: return 0
+    try:
+        with DB_WRITE_SECONDS.labels("delete_stations").time(), _write_lock:
+            with _transaction(_writer()) as conn:
+                deleted = conn.execute(
+                    "DELETE FROM stations WHERE uuid IN (SELECT value FROM json_each(?))",
+                    (json.dumps(uuids),),
+                ).rowcount
+                if deleted:
+                    conn.execute(_BUMP_VERSION_SQL)
+            if deleted:
+                _load_stations_version(conn)
+        return deleted
+    except Exception as e:
+        log.error("Write error: %s", e)
+        return 0
+
+
+# Two index lookups (source, key) rather than one OR, which SQLite answers
+# by scanning every row of the source
+_DEDUPE_MATCHES_SQL = f"""
+    SELECT {", ".join(INGESTED_COLUMNS)} FROM stations
+    WHERE source = ? AND url_key IN (SELECT value FROM json_each(?))
+    UNION
+    SELECT {", ".join(INGESTED_COLUMNS)} FROM stations
+    WHERE source = ? AND place_key IN (SELECT value FROM json_each(?))
+"""
+
+
+def dedupe_matches(source: str, url_keys: List[str], place_keys: List[str]) -> List[Dict]:
+    """Stored stations of `source` sharing any of the given duplicate keys (every ingested column)."""
+    try:
+        rows = _reader().execute(_DEDUPE_MATCHES_SQL, (source, json.dumps(url_keys), source, json.dumps(place_keys))).fetchall()
+        return [dict(r) for r in rows]
+    except Exception as e:
+        log.error("Read error: %s", e)
+        return []
+
+
+_CROWDED_SQL = """
+    SELECT s.uuid, s.raw_lat, s.raw_lng, s.lat, s.lng, c.crowd
+    FROM stations s
+    JOIN (SELECT cell, COUNT(*) AS crowd FROM stations
+          WHERE cell IS NOT NULL GROUP BY cell HAVING COUNT(*) > 1) c USING (cell)
+"""
+
+_RESET_LONE_SQL = """
+    UPDATE stations SET lat = raw_lat, lng = raw_lng
+    WHERE raw_lat IS NOT NULL AND (lat IS NOT raw_lat OR lng IS NOT raw_lng)
+      AND cell IN (SELECT cell FROM stations WHERE cell IS NOT NULL
+                   GROUP BY cell HAVING COUNT(*) = 1)
+"""
+
+
+def iter_crowded_stations(chunk_size: int = 1000):
+    """Lists of (uuid, raw_lat, raw_lng, lat, lng, crowd) for stations sharing their grid cell."""
+    cursor = _reader().execute(_CROWDED_SQL)
+    while True:
+        chunk = cursor.fetchmany(chunk_size)
+        if not chunk: return
+        yield [tuple(r) for r in chunk]
+
+
+def set_positions(positions: List[Tuple[float, float, str]]) -> int:
+    """Move stations to new (lat, lng, uuid) positions, in one transaction."""
+    if not positions: return 0
+    try:
+        with DB_WRITE_SECONDS.labels("set_positions").time(), _write_lock:
+            with _transaction(_writer()) as conn:
+                changed = conn.executemany("UPDATE stations SET lat = ?, lng = ? WHERE uuid = ?", positions).rowcount
+                if changed:
+                    conn.execute(_BUMP_VERSION_SQL)
+            if changed:
+                _load_stations_version(conn)
+        return changed
+    except Exception as e:
+        log.error("Write error: %s", e)
+        return 0
+
+
+def reset_lone_positions() -> int:
+    """Move stations that no longer share their cell back to their own coordinates."""
+    try:
+        with DB_WRITE_SECONDS.labels("reset_lone_positions").time(), _write_lock:
+            with _transaction(_writer()) as conn:
+                changed = conn.execute(_RESET_LONE_SQL).rowcount
+                if changed:
+                    conn.execute(_BUMP_VERSION_SQL)
+            if changed:
+                _load_stations_version(conn)
+        return changed
+    except Exception as e:
+        log.error("Write error: %s", e)
+        return 0
+
+
+def alternate_urls(url: str) -> List[str]:
+    """Failover URLs recorded for the station streaming from `url`, if any."""
+    try:
+        row = _reader().execute(
+            "SELECT alt_urls FROM stations WHERE url = ? AND alt_urls IS NOT NULL LIMIT 1", (url,)
+        ).fetchone()
+        return json.loads(row["alt_urls"]) if row else []
+    except Exception as e:
+        log.error("Read error: %s", e)
+        return []
+
 
 def query_stations(limit: int = 2000):
     try:
-        db = get_db()
-        # Verify table exists before querying
-        if "stations" not in db.table_names():
+        return [dict(row) for row in _reader().execute(_QUERY_STATIONS_SQL, (limit,))]
+    except Exception as e:
+        log.error("Read error: %s", e)
+        return []
+
+
+def query_stations_in_bbox(west: float, south: float, east: float, north: float,
+                           limit: int = 5000) -> List[Dict]:
+    """Stations inside a lng/lat box via the R*Tree. west > east means the box crosses ±180°."""
+    lng_ranges = [(west, east)] if west <= east else [(west, 180.0), (-180.0, east)]
+    try:
+        conn = _reader()
+        rows: List[Dict] = []
+        for lo, hi in lng_ranges:
+            params = {"south": south, "north": north, "west": lo, "east": hi, "limit": limit - len(rows)}
+            rows.extend(dict(row) for row in conn.execute(_QUERY_BBOX_SQL, params))
+            if len(rows) >= limit:
+                break
+        return rows
+    except Exception as e:
+        log.error("Read error: %s", e)
+        return []
+
+
+def get_station(uuid: str) -> Optional[Dict]:
+    try:
+        row = _reader().execute(_GET_STATION_SQL, (uuid,)).fetchone()
+        if row is None: return None
+        station = dict(row)
+        station["alt_urls"] = json.loads(station["alt_urls"]) if station["alt_urls"] else []
+        return station
+    except Exception as e:
+        log.error("Read error: %s", e)
+        return None
+
+
+def iter_station_points():
+    """(lat, lng, tags) for every geo-valid station — the input to clustering."""
+    return _reader().execute(_QUERY_POINTS_SQL)
+
+
+def probe_candidates(older_than: float, limit: int) -> List[Dict]:
+    """Up to `limit` stations (id, url) never probed or last probed before `older_than`, oldest first."""
+    try:
+        return [dict(row) for row in _reader().execute(_PROBE_CANDIDATES_SQL, (older_than, limit))]
+    except Exception as e:
+        log.error("Read error: %s", e)
+        return []
+
+
+def record_probe_results(results: List[Dict], decay: float) -> int:
+    """Fold a batch of probe results into each station's health score, in one transaction.
+
+    Each result carries id, sample (0..1, or None to leave the score alone),
+    probe_at, connect_ms, ttfb_ms, status and content_type. Returns how many
+    stations crossed HEALTH_HIDE_BELOW (the only change the cached payloads
+    can see). The stations version is left alone: the prober publishes
+    those changes with bump_stations_version(), at most once per interval.
+    """
+    if not results: return 0
+    rows = [dict(r, decay=decay) for r in results]
+    ids = json.dumps([r["id"] for r in rows])
+    try:
+        with DB_WRITE_SECONDS.labels("record_probe_results").time(), _write_lock:
+            with _transaction(_writer()) as conn:
+                before = {row[0] for row in conn.execute(_VISIBLE_IDS_SQL, (ids,))}
+                conn.executemany(_RECORD_PROBE_SQL, rows)
+                after = {row[0] for row in conn.execute(_VISIBLE_IDS_SQL, (ids,))}
+        return len(before ^ after)
+    except Exception as e:
+        log.error("Write error: %s", e)
+        return 0
+
+
+def bump_stations_version() -> bool:
+    """Invalidate every cached payload (in all workers) for changes made without a bump."""
+    try:
+        with DB_WRITE_SECONDS.labels("bump_stations_version").time(), _write_lock:
+            with _transaction(_writer()) as conn:
+                conn.execute(_BUMP_VERSION_SQL)
+            _load_stations_version(conn)
+        return True
+    except Exception as e:
+        log.error("Write error: %s", e)
+        return False
+
+
+def _fts_match(text: str) -> str:
+    # Every word must match as a prefix (type-ahead). Words are quoted so FTS5
+    # operators (AND, NEAR, column filters) in user input are taken literally.
+    return " ".join(f'"{w}"*' for w in re.findall(r"\w+", text))
+
+
+def search_stations(text: str, bbox: Optional[Tuple[float, float, float, float]] = None,
+                    limit: int = 50) -> List[Dict]:
+    """Full-text station search over name, tags and country, best matches first."""
+    match = _fts_match(text).strip()
+    if not match:
+        return []
+    west, south, east, north = bbox or (-180.0, -90.0, 180.0, 90.0)
+    # A box crossing ±180° is two longitude ranges; otherwise both ranges coincide
+    lng_ranges = (west, east, west, east) if west <= east else (west, 180.0, -180.0, east)
+    params = dict(zip(("west1", "east1", "west2", "east2"), lng_ranges),
+                  match=match, south=south, north=north, limit=limit)
+    try:
+        return [dict(row) for row in _reader().execute(_SEARCH_SQL, params)]
+    except Exception as e:
+        log.error("Search error: %s", e)
+        return []
+
+
+# Older run reports are pruned on write
+INGESTION_RUNS_KEPT = 50
+
+
+def record_ingestion_run(report: Dict):
+    try:
+        with DB_WRITE_SECONDS.labels("record_ingestion_run").time(), _write_lock, _transaction(_writer()) as conn:
+            conn.execute(
+                "INSERT INTO ingestion_runs (started_at, finished_at, report) VALUES (?, ?, ?)",
+                (report["started_at"], report["finished_at"], json.dumps(report)),
+            )
+            conn.execute(
+                "DELETE FROM ingestion_runs WHERE id <= (SELECT MAX(id) FROM ingestion_runs) - ?",
+                (INGESTION_RUNS_KEPT,),
+            )
+    except Exception as e:
+        log.error("Write error: %s", e)
+
+
+def latest_ingestion_run() -> Optional[Dict]:
+    try:
+        row = _reader().execute("SELECT report FROM ingestion_runs ORDER BY id DESC LIMIT 1").fetchone()
+        return json.loads(row["report"]) if row else None
+    except Exception as e:
+        log.error("Read error: %s", e)
+        return None
+
+
+def record_source_refresh(source: str, status: str):
+    try:
+        with DB_WRITE_SECONDS.labels("record_source_refresh").time(), _write_lock, _transaction(_writer()) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO source_refreshes (source, last_run_at, status) VALUES (?, ?, ?)",
+                (source, time.time(), status),
+            )
+    except Exception as e:
+        log.error("Write error: %s", e)
+
+
+def source_refreshes() -> Dict[str, Dict]:
+    """{source: {"last_run_at": epoch, "status": ...}} for every source that has run."""
+    try:
+        return {
+            row["source"]: {"last_run_at": row["last_run_at"], "status": row["status"]}
+            for row in _reader().execute("SELECT source, last_run_at, status FROM source_refreshes")
+        }
+    except Exception as e:
+        log.error("Read error: %s", e)
+        return {}
+
+
+def get_http_validators(url: str) -> Optional[Dict]:
+    try:
+        row = _reader().execute(
+            "SELECT etag, last_modified, rows FROM http_validators WHERE url = ?", (url,)
+        ).fetchone()
+        return dict(row) if row else None
+    except Exception as e:
+        log.error("Read error: %s", e)
+        return None
+
+
+def save_http_validators(url: str, etag: Optional[str], last_modified: Optional[str], rows: int):
+    try:
+        with DB_WRITE_SECONDS.labels("save_http_validators").time(), _write_lock, _transaction(_writer()) as conn:
+            if etag or last_modified:
+                conn.execute(
+                    "INSERT OR REPLACE INTO http_validators (url, etag, last_modified, rows, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (url, etag, last_modified, rows, time.time()),
+                )
+            else:
+                conn.execute("DELETE FROM http_validators WHERE url = ?", (url,))
+    except Exception as e:
+        log.error("Write error: %s", e)
+
+
+# ── WORKER COORDINATION ──────────────────────────────────────────────────────
+
+# Takes the lease if it is free, expired or already ours; otherwise a no-op
+_ACQUIRE_LEASE_SQL = """
+    INSERT INTO leases (name, holder, expires_at) VALUES (:name, :holder, :expires_at)
+    ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+    WHERE leases.holder = excluded.holder OR leases.expires_at < :now
+"""
+
+
+def try_acquire_lease(name: str, holder: str, ttl: float) -> bool:
+    """Take or renew lease `name` for `ttl` seconds. True if `holder` now holds it."""
+    now = time.time()
+    params = {"name": name, "holder": holder, "expires_at": now + ttl, "now": now}
+    try:
+        with _write_lock, _transaction(_writer()) as conn:
+            return conn.execute(_ACQUIRE_LEASE_SQL, params).rowcount == 1
+    except Exception as e:
+        # Usually another worker holding the write lock past busy_timeout
+        log.warning("Lease %s not renewed: %s", name, e)
+        return False
+
+
+def release_lease(name: str, holder: str):
+    try:
+        with _write_lock, _transaction(_writer()) as conn:
+            conn.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+    except Exception as e:
+        log.error("Write error: %s", e)
+
+
+def lease_holder(name: str) -> Optional[Dict]:
+    try:
+        row = _reader().execute("SELECT holder, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+        return dict(row) if row else None
+    except Exception as e:
+        log.error("Read error: %s", e)
+        return None
+
+
+def request_refresh(source: Optional[str] = None):
+    """Queue a refresh (of one source, or all with None) for whichever worker ingests."""
+    try:
+        with _write_lock, _transaction(_writer()) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO refresh_requests (source, requested_at) VALUES (?, ?)",
+                (source or "", time.time()),
+            )
+    except Exception as e:
+        log.error("Write error: %s", e)
+
+
+def take_refresh_requests() -> List[Optional[str]]:
+    """Pop every queued refresh request: source names, None meaning all sources."""
+    try:
+        # Polled every scheduler tick: stay off the write lock while the queue is empty
+        if _reader().execute("SELECT 1 FROM refresh_requests LIMIT 1").fetchone() is None:
             return []
-        return list(db.query(f"SELECT * FROM stations WHERE lat IS NOT NULL AND lng IS NOT NULL LIMIT {limit}"))
+        with _write_lock, _transaction(_writer()) as conn:
+            sources = [row[0] for row in conn.execute("SELECT source FROM refresh_requests")]
+            if sources:
+                conn.execute("DELETE FROM refresh_requests")
+        return [s or None for s in sources]
     except Exception as e:
-        print(f"❌ Read Error: {e}")
-        return []
\ No newline at end of file
+        log.error("Write error: %s", e)
+        return []
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.database import bump_stations_version, probe_candidates, record_probe_results
+from app.upstream import open_upstream, stream_kind
+
+log = logging.getLogger(__name__)
+
+# Set HEALTH_PROBES=0 to turn the prober off (e.g. on a metered uplink)
+HEALTH_PROBES_ENABLED = os.getenv("HEALTH_PROBES", "1") != "0"
+# A station is re-probed once its last result is this old
+PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", str(30 * 60)))
+# Stations hidden or shown by probes reach the cached payloads at most this
+# often (and at the end of every probe cycle): each publish rebuilds them all
+HEALTH_PUBLISH_INTERVAL = float(os.getenv("HEALTH_PUBLISH_INTERVAL", "300"))
+
+
+class HealthProber:
+    """Background prober that scores every station's upstream, oldest result first.
+
+    A probe is the same handshake tcp_stream does for a listener (connect,
+    HTTP/1.0 GET, headers, first body byte), so "healthy" means "would
+    actually play through the proxy". Each result is folded into a decayed
+    score — one bad probe doesn't hide a station, a run of them does, and a
+    station that comes back earns its way back up.
+
+    Visibility changes are batched up: the stations version is bumped (and
+    `on_visibility_change` called) once HEALTH_PUBLISH_INTERVAL has passed
+    since the first unpublished change, or when no station is left to probe.
+    """
+
+    CONCURRENCY = 32
+    TIMEOUT = 8.0           # connect + headers + first byte
+    BATCH_SIZE = 500
+    IDLE_SLEEP = 60.0       # nothing due: check again after this long
+    OFFLINE_SLEEP = 120.0   # a whole batch failed: assume our own network is down
+    # Weight kept by the old score on every new result
+    DECAY = 0.6
+    # Time to first byte under FAST_SECONDS scores 1.0, at SLOW_SECONDS or more 0.5
+    FAST_SECONDS = 1.0
+    SLOW_SECONDS = 4.0
+
+    def __init__(self, on_visibility_change: Optional[Callable[[], Awaitable[None]]] = None):
+        self._on_visibility_change = on_visibility_change
+        self.probed = 0
+        self.failed = 0
+        self.flipped = 0
+        self.batches = 0
+        self.last_batch_at: Optional[float] = None
+        self.unpublished = 0                        # visibility changes not in the payloads yet
+        self._unpublished_since: Optional[float] = None
+
+    def _sample(self, status: int, content_type: str, ttfb: float) -> float:
+        if not 200 <= status < 300 or content_type.startswith("text/html"):
+            # A redirect or an HTML landing page won't play through tcp_stream either
+            return 0.0
+        slowness = (ttfb - self.FAST_SECONDS) / (self.SLOW_SECONDS - self.FAST_SECONDS)
+        return 1.0 - 0.5 * min(1.0, max(0.0, slowness))
+
+    async def probe(self, station: Dict, semaphore: asyncio.Semaphore) -> Dict:
+        result = {
+            "id": station["id"],
+            "sample": None,
+            "probe_at": time.time(),
+            "connect_ms": None,
+            "ttfb_ms": None,
+            "status": None,
+            "content_type": None,
+        }
+        if stream_kind(station["url"]) != "tcp":
+            # yt-dlp / SoundCloud stations are resolved per play, not probeable here
+            return result
+
+        async with semaphore:
+            started = time.monotonic()
+            upstream = None
+            try:
+                async def _handshake():
+                    nonlocal upstream
+                    upstream = await open_upstream(station["url"])
+                    first = await upstream.reader.read(1)
+                    return bool(first)
+
+                got_byte = await asyncio.wait_for(_handshake(), self.TIMEOUT)
+                ttfb = time.monotonic() - started
+                content_type = upstream.headers.get("content-type", "")
+                result.update(
+                    connect_ms=round(upstream.connect_time * 1000, 1),
+                    ttfb_ms=round(ttfb * 1000, 1),
+                    status=upstream.status,
+                    content_type=content_type or None,
+                    sample=self._sample(upstream.status, content_type, ttfb) if got_byte else 0.0,
+                )
+            except (asyncio.TimeoutError, OSError, ValueError, asyncio.IncompleteReadError,
+                    asyncio.LimitOverrunError, UnicodeError):
+                result["sample"] = 0.0
+            finally:
+                if upstream is not None:
+                    upstream.writer.close()
+        return result
+
+    async def run_batch(self) -> int:
+        """Probe one batch of due stations and record the results.
+
+        Returns the batch size, 0 when nothing is due, or -1 when the batch
+        was discarded because every probe failed.
+        """
+        stations = await asyncio.to_thread(probe_candidates, time.time() - PROBE_INTERVAL, self.BATCH_SIZE)
+        if not stations:
+            return 0
+        semaphore = asyncio.Semaphore(self.CONCURRENCY)
+        results: List[Dict] = await asyncio.gather(*(self.probe(s, semaphore) for s in stations))
+        probed = [r for r in results if r["sample"] is not None]
+        failed = sum(1 for r in probed if r["sample"] == 0.0)
+        if probed and failed == len(probed) and len(probed) >= 10:
+            # Every single upstream failing says more about us than about them
+            log.warning("Health probe: all %d probes failed, assuming the network is down", failed)
+            self.failed += failed
+            return -1
+
+        flipped = await asyncio.to_thread(record_probe_results, results, self.DECAY)
+        self.probed += len(probed)
+        self.failed += failed
+        self.flipped += flipped
+        self.batches += 1
+        self.last_batch_at = time.time()
+        log.info("Health probe batch done", extra={"probed": len(probed), "failed": failed, "flipped": flipped})
+        if flipped:
+            self.unpublished += flipped
+            if self._unpublished_since is None:
+                self._unpublished_since = time.monotonic()
+        if self.unpublished and time.monotonic() - self._unpublished_since >= HEALTH_PUBLISH_INTERVAL:
+            await self.publish()
+        return len(results)
+
+    async def publish(self):
+        """Make the visibility changes recorded so far reach the cached payloads."""
+        if not self.unpublished:
+            return
+        log.info("Publishing %d station visibility changes", self.unpublished)
+        self.unpublished, self._unpublished_since = 0, None
+        await asyncio.to_thread(bump_stations_version)
+        if self._on_visibility_change is not None:
+            await self._on_visibility_change()
+
+    async def run_forever(self):
+        try:
+            while True:
+                try:
+                    done = await self.run_batch()
+                    if done == 0:
+                        # End of a probe cycle
+                        await self.publish()
+                except Exception as e:
+                    log.exception("Health probe error: %s", e)
+                    done = 0
+                if done == 0:
+                    await asyncio.sleep(self.IDLE_SLEEP)
+                elif done < 0:
+                    await asyncio.sleep(self.OFFLINE_SLEEP)
+        finally:
+            if self.unpublished:
+                # Stopping (lost the lease): don't leave changes only the next leader's cycle would publish
+                bump_stations_version()
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": HEALTH_PROBES_ENABLED,
+            "probed": self.probed,
+            "failed": self.failed,
+            "visibility_changes": self.flipped,
+            "unpublished_changes": self.unpublished,
+            "batches": self.batches,
+            "last_batch_at": self.last_batch_at,
+        }
@@ -0,0 +1,330 @@
+import asyncio
+import importlib
+import json
+import logging
+import os
+import pkgutil
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from app import database
+from app.database import (
+    delete_stations, upsert_stations, record_ingestion_run, record_source_refresh, source_refreshes,
+    take_refresh_requests,
+)
+from app.metrics import PARSER_DURATION, ROWS_CHANGED, ROWS_INGESTED
+import app.parsers as parsers_package
+
+log = logging.getLogger(__name__)
+
+# Upper bound for one parser's whole fetch_and_parse; a parser class can
+# override it with its own `timeout` attribute.
+PARSER_TIMEOUT = float(os.getenv("INGEST_PARSER_TIMEOUT", "300"))
+# How often a source is refreshed unless its parser sets `refresh_interval`
+DEFAULT_REFRESH_INTERVAL = float(os.getenv("REFRESH_INTERVAL", str(6 * 3600)))
+# A source whose last run failed is retried sooner than its normal interval
+RETRY_INTERVAL = 15 * 60
+# fetch_and_parse results are normalized and written this many rows per
+# transaction, so readers are never blocked behind one huge write
+UPSERT_BATCH = 1000
+
+
+class LazyParser:
+    """Stand-in for a parser class known from the registry cache.
+
+    Carries the class attributes ingestion reads (source_name,
+    refresh_interval, timeout, dedupe_by_place) and only imports the
+    parser's module when it is actually instantiated for a run.
+    """
+
+    def __init__(self, module: str, class_name: str, attrs: Dict):
+        self.module = module
+        self.class_name = class_name
+        for name, value in attrs.items():
+            setattr(self, name, value)
+
+    def load(self) -> type:
+        return getattr(importlib.import_module(self.module), self.class_name)
+
+    def __call__(self):
+        return self.load()()
+
+    def __repr__(self) -> str:
+        return f"<LazyParser {self.module}.{self.class_name}>"
+
+
+# Class attributes recorded in the registry cache; anything else needs the class
+_REGISTRY_ATTRS = ("source_name", "refresh_interval", "timeout", "dedupe_by_place")
+
+
+def _registry_path() -> str:
+    # Next to the database, like the metadata cache
+    return os.getenv("PARSER_REGISTRY_PATH") or os.path.join(
+        os.path.dirname(database.DB_PATH) or ".", "parser-registry.json"
+    )
+
+
+def _load_registry() -> Dict:
+    try:
+        with open(_registry_path(), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_registry(registry: Dict):
+    path = _registry_path()
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(registry, f, indent=1)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        log.warning("Parser registry write failed (%s): %s", path, e)
+
+
+def _parser_classes(module) -> Dict[str, type]:
+    return {
+        attr_name: attr for attr_name, attr in vars(module).items()
+        if isinstance(attr, type) and hasattr(attr, 'fetch_and_parse') and hasattr(attr, 'source_name')
+    }
+
+
+def discover_parsers(lazy: bool = True) -> List[type]:
+    """Every class in app/parsers/*.py that has `source_name` and `fetch_and_parse`.
+
+    With `lazy`, modules whose file is unchanged since the last scan are not
+    imported: their parsers come back as LazyParser stand-ins built from the
+    registry cache, and the yt-dlp / httpx imports they pull in are paid on
+    the first run instead of at startup.
+    """
+    registry = _load_registry() if lazy else {}
+    updated = {}
+    found = []
+    for module_info in pkgutil.iter_modules(parsers_package.__path__):
+        if module_info.ispkg: continue
+        full_module_name = f"app.parsers.{module_info.name}"
+        try:
+            stat = os.stat(os.path.join(module_info.module_finder.path, f"{module_info.name}.py"))
+            stamp = [stat.st_mtime_ns, stat.st_size]
+        except OSError:
+            stamp = None
+        cached = registry.get(full_module_name)
+        if lazy and stamp is not None and cached is not None and cached["stamp"] == stamp:
+            updated[full_module_name] = cached
+            found.extend(LazyParser(full_module_name, p["class"], p["attrs"]) for p in cached["parsers"])
+            continue
+        try:
+            module = importlib.import_module(full_module_name)
+        except Exception as e:
+            log.error("Cannot import parser module %s: %s", full_module_name, e)
+            continue
+        classes = _parser_classes(module)
+        found.extend(classes.values())
+        if stamp is not None:
+            updated[full_module_name] = {
+                "stamp": stamp,
+                "parsers": [
+                    {"class": name, "attrs": {a: getattr(cls, a) for a in _REGISTRY_ATTRS if hasattr(cls, a)}}
+                    for name, cls in classes.items()
+                ],
+            }
+    if updated != registry:
+        _save_registry(updated)
+    return found
+
+
+async def _run_parser(parser_cls: type) -> Dict:
+    """Run one parser under its timeout, normalizing and upserting its results the moment they arrive.
+
+    Parsers that define `stream_batches()` are consumed batch by batch, each
+    its own transaction; otherwise `fetch_and_parse()` is awaited and its
+    list written UPSERT_BATCH rows at a time. Every batch goes through
+    normalize_batch (duplicates collapsed against the batch and the stored
+    stations), and crowded grid cells are spread once the run is written.
+    """
+    entry = {
+        "parser": parser_cls.source_name,
+        "status": "ok",
+        "items": 0,
+        "changed": 0,
+        "duplicates": 0,
+        "duration": 0.0,
+        "error": None,
+    }
+    started = time.monotonic()
+    # Curated sources list distinct streams under one name at one spot
+    by_place = getattr(parser_cls, "dedupe_by_place", True)
+
+    async def _ingest():
+        # numpy is only needed once a run has something to write
+        from app.normalize import normalize_batch, spread_crowded_cells
+
+        async def _write(batch: List[Dict]):
+            entry["items"] += len(batch)
+            rows, dropped = await asyncio.to_thread(normalize_batch, batch, entry["parser"], by_place)
+            entry["duplicates"] += len(dropped)
+            entry["changed"] += await asyncio.to_thread(upsert_stations, rows)
+            if dropped:
+                entry["changed"] += await asyncio.to_thread(delete_stations, dropped)
+
+        parser = parser_cls()
+        if hasattr(parser, "stream_batches"):
+            # Large sources hand over fixed-size batches as they parse them.
+            # The next batch is only pulled once this one is committed, so
+            # a parser may treat "handed over" as "stored"
+            async for batch in parser.stream_batches():
+                await _write(batch)
+        else:
+            stations = await parser.fetch_and_parse() or []
+            for start in range(0, len(stations), UPSERT_BATCH):
+                await _write(stations[start:start + UPSERT_BATCH])
+        entry["changed"] += await asyncio.to_thread(spread_crowded_cells)
+
+    timeout = getattr(parser_cls, "timeout", PARSER_TIMEOUT)
+    try:
+        await asyncio.wait_for(_ingest(), timeout)
+    except asyncio.TimeoutError:
+        entry["status"] = "timeout"
+        entry["error"] = f"no result after {timeout:.0f}s"
+    except Exception as e:
+        entry["status"] = "error"
+        entry["error"] = str(e)
+    entry["duration"] = round(time.monotonic() - started, 3)
+    await asyncio.to_thread(record_source_refresh, entry["parser"], entry["status"])
+
+    PARSER_DURATION.labels(entry["parser"], entry["status"]).observe(entry["duration"])
+    ROWS_INGESTED.labels(entry["parser"]).inc(entry["items"])
+    ROWS_CHANGED.labels(entry["parser"]).inc(entry["changed"])
+    log.log(logging.INFO if entry["status"] == "ok" else logging.ERROR,
+            "Parser %s finished: %s", entry["parser"], entry["status"], extra=entry)
+    return entry
+
+
+async def run_ingestion(parsers: Optional[List[type]] = None) -> Dict:
+    """Run the given parsers (default: all discovered) concurrently on the current event loop.
+
+    Returns (and records in the ingestion_runs table) a report with each
+    parser's status, duration and item counts.
+    """
+    started_at = time.time()
+    if parsers is None:
+        parsers = discover_parsers()
+    log.info("Ingesting from %d parsers", len(parsers))
+    results = await asyncio.gather(*(_run_parser(p) for p in parsers))
+    report = {
+        "started_at": started_at,
+        "finished_at": time.time(),
+        "duration": round(time.time() - started_at, 3),
+        "parsers": list(results),
+    }
+    await asyncio.to_thread(record_ingestion_run, report)
+    return report
+
+
+class RefreshScheduler:
+    """Keeps every source fresh on its own interval, one ingestion run at a time.
+
+    `refresh()` is single-flight: a call made while a run of the same
+    sources (or more) is in progress joins that run instead of starting a
+    second one. Calls for other sources are merged into one follow-up run
+    that starts when the current one ends. Due times come from the
+    source_refreshes table, so a restart only re-fetches overdue sources.
+    Refreshes queued by other worker processes (request_refresh) are picked
+    up on the next tick. Cancelling `run_forever()` (or calling `cancel()`)
+    stops the run in progress as well.
+    """
+
+    TICK = 10.0     # seconds between due / queued-request checks
+
+    def __init__(self, after_run: Callable[[Dict], Awaitable[None]]):
+        self._after_run = after_run
+        self._current: Optional[asyncio.Task] = None
+        self._current_sources: Set[str] = set()
+        self._follow_up: Optional[asyncio.Task] = None
+        self._follow_up_sources: Set[str] = set()
+
+    @property
+    def running(self) -> bool:
+        return self._current is not None and not self._current.done()
+
+    def _start(self, parsers: Optional[List[type]]) -> asyncio.Task:
+        """The task whose report covers `parsers` (default: all): a new run, the current one, or the follow-up."""
+        sources = {p.source_name for p in (parsers if parsers is not None else discover_parsers())}
+        if self.running and sources <= self._current_sources:
+            return self._current
+        if self._follow_up is not None and not self._follow_up.done():
+            self._follow_up_sources |= sources
+            return self._follow_up
+        if self.running:
+            self._follow_up_sources = set(sources)
+            self._follow_up = asyncio.get_running_loop().create_task(self._run_after(self._current))
+            return self._follow_up
+        self._current_sources = sources
+        self._current = asyncio.get_running_loop().create_task(self._run(parsers))
+        return self._current
+
+    async def _run_after(self, previous: asyncio.Task) -> Dict:
+        await asyncio.wait({previous})
+        sources, self._follow_up_sources = self._follow_up_sources, set()
+        # Calls from here on start (or join) a run of their own
+        self._follow_up = None
+        self._current_sources = sources
+        self._current = asyncio.current_task()
+        return await self._run([p for p in discover_parsers() if p.source_name in sources])
+
+    async def refresh(self, parsers: Optional[List[type]] = None) -> Dict:
+        # Shielded: a caller going away (HTTP client disconnect) must not abort the run
+        return await asyncio.shield(self._start(parsers))
+
+    def cancel(self):
+        """Abort the run in progress and the follow-up, if any (the worker lost the ingestion lease)."""
+        for task in (self._follow_up, self._current):
+            if task is not None and not task.done():
+                task.cancel()
+
+    async def _run(self, parsers: Optional[List[type]]) -> Dict:
+        report = await run_ingestion(parsers)
+        await self._after_run(report)
+        return report
+
+    async def due_parsers(self) -> List[type]:
+        state = await asyncio.to_thread(source_refreshes)
+        now = time.time()
+        due = []
+        for parser_cls in discover_parsers():
+            last = state.get(parser_cls.source_name)
+            interval = getattr(parser_cls, "refresh_interval", DEFAULT_REFRESH_INTERVAL)
+            if last and last["status"] != "ok":
+                interval = min(interval, RETRY_INTERVAL)
+            if last is None or now - last["last_run_at"] >= interval:
+                due.append(parser_cls)
+        return due
+
+    async def requested_parsers(self) -> List[type]:
+        sources = await asyncio.to_thread(take_refresh_requests)
+        if not sources:
+            return []
+        parsers = discover_parsers()
+        if None in sources:
+            return parsers
+        return [p for p in parsers if p.source_name in sources]
+
+    async def run_forever(self):
+        while True:
+            try:
+                requested = await self.requested_parsers()
+                if requested:
+                    log.info("Requested refresh: %s", ", ".join(p.source_name for p in requested))
+                    # Taken off the queue, so never dropped: joins a run that
+                    # covers them or waits for a follow-up. Not shielded:
+                    # cancelling the scheduler cancels its run too
+                    await self._start(requested)
+                due = await self.due_parsers()
+                if due and not self.running:
+                    log.info("Scheduled refresh: %s", ", ".join(p.source_name for p in due))
+                    await self._start(due)
+            except Exception as e:
+                log.exception("Scheduler error: %s", e)
+            await asyncio.sleep(self.TICK)
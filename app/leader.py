@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from typing import Awaitable, Callable, Dict, Optional
+
+from app.database import lease_holder, release_lease, try_acquire_lease
+
+log = logging.getLogger(__name__)
+
+# The lease outlives a few missed renewals; a crashed leader is replaced
+# within LEASE_TTL seconds
+LEASE_TTL = float(os.getenv("LEADER_LEASE_TTL", "30"))
+LEASE_RENEW = LEASE_TTL / 3
+
+
+class LeaderLease:
+    """Elects one worker process to own background work, via a row in the leases table.
+
+    Every worker runs `run_forever()`. Whoever holds the lease keeps renewing
+    it and runs `on_elected()` as a task; everyone else retries every
+    LEASE_RENEW seconds and takes over once the holder stops renewing. A
+    leader that fails to renew in time cancels its task before anyone else
+    can have taken the lease, so the work never runs twice.
+    """
+
+    def __init__(self, name: str, on_elected: Callable[[], Awaitable[None]]):
+        self.name = name
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._on_elected = on_elected
+        self._task: Optional[asyncio.Task] = None
+        self.elections = 0
+
+    @property
+    def is_leader(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def run_forever(self):
+        loop = asyncio.get_running_loop()
+        renewed_at = None
+        try:
+            while True:
+                held = await asyncio.to_thread(try_acquire_lease, self.name, self.holder, LEASE_TTL)
+                now = loop.time()
+                if held:
+                    renewed_at = now
+                    if not self.is_leader:
+                        self.elections += 1
+                        log.info("Elected %s leader (%s)", self.name, self.holder)
+                        self._task = loop.create_task(self._on_elected())
+                elif self.is_leader and (renewed_at is None or now - renewed_at >= LEASE_TTL - LEASE_RENEW):
+                    # Step down while the lease is still ours on paper
+                    log.warning("Lost %s lease, stopping leader work", self.name)
+                    self._task.cancel()
+                    self._task = None
+                await asyncio.sleep(LEASE_RENEW)
+        finally:
+            if self._task is not None:
+                self._task.cancel()
+                await asyncio.to_thread(release_lease, self.name, self.holder)
+
+    def stats(self) -> Dict:
+        return {
+            "name": self.name,
+            "holder": self.holder,
+            "is_leader": self.is_leader,
+            "elections": self.elections,
+            "current": lease_holder(self.name),
+        }
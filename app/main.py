@@ -1,19 +1,42 @@
 import uvicorn
 import asyncio
-import importlib
-import pkgutil
-from urllib.parse import urlparse
+from typing import Dict, Optional
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, BackgroundTasks, Query
-from fastapi.responses import StreamingResponse, Response
+from fastapi import FastAPI, BackgroundTasks, Query, Request
+from fastapi.responses import StreamingResponse, Response, JSONResponse
 from fastapi.staticfiles import StaticFiles
+import importlib
+import json
+import logging
 import os
-import subprocess
-import yt_dlp
-import httpx
+import time
+from functools import partial
 
-from app.database import upsert_stations, query_stations
-import app.parsers as parsers_package
+from app.database import (
+    init_db, close_db, query_stations, query_stations_in_bbox,
+    iter_station_points, search_stations, stations_version, latest_ingestion_run,
+    get_station, alternate_urls, reload_stations_version, request_refresh, lease_holder,
+)
+from app.broadcast import hubs, normalize_stream_url
+from app.upstream import youtube_stream, soundcloud_stream, tcp_stream, stream_kind, is_live, preconnects
+from app.connections import close_http_client, dns_cache, tls_context
+from app.resolver import ResolverCache, signed_url_expiry
+from app.processes import ProcessLimitError, stream_processes
+from app.snapshot import SnapshotCache, columnar_body
+from app.spatial import ClusterIndex, CLUSTER_MAX_ZOOM, parse_bbox
+from app.ingestion import RefreshScheduler, discover_parsers
+from app.health import HealthProber, HEALTH_PROBES_ENABLED
+from app.nowplaying import now_playing
+from app.leader import LeaderLease
+from app.log import configure_logging
+from app.metrics import (
+    REGISTRY, Counter, Gauge, UPSTREAM_ERRORS, YTDLP_RESOLVE_SECONDS,
+)
+
+configure_logging()
+log = logging.getLogger(__name__)
+# Per-request proxy events; DEBUG by default so they cost nothing (see app/log.py)
+proxy_log = logging.getLogger("app.proxy")
 
 
 _EXT_TO_MEDIA_TYPE = {
@@ -29,204 +52,392 @@ def _resolve_soundcloud_url(url: str) -> tuple[str, str]:
     """Resolve a SoundCloud page URL to its ephemeral CDN audio URL via yt-dlp.
 
     Returns (cdn_url, media_type).
-    Runs synchronously — always call via asyncio.to_thread from async context.
+    Runs synchronously — call through soundcloud_resolver, which caches results
+    and runs misses in a worker thread.
 
     Format preference: direct HTTP progressive streams first (browser-compatible),
     HLS/m3u8 last — browsers cannot play an HLS manifest via a plain <audio> element.
     SoundCloud always exposes http_mp3_128 alongside the higher-quality HLS stream.
     """
+    import yt_dlp   # deferred to first use (or the background pre-warm), see lifespan
+
     ydl_opts = {
         # Prefer progressive HTTP streams; HLS requires a dedicated player
         "format": "http_mp3_128/bestaudio[protocol=https]/bestaudio[protocol=http]/bestaudio",
         "quiet": True,
         "noplaylist": True,
     }
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+    with YTDLP_RESOLVE_SECONDS.labels("soundcloud").time(), yt_dlp.YoutubeDL(ydl_opts) as ydl:
         info = ydl.extract_info(url, download=False)
     ext      = info.get("ext", "mp3")
     protocol = info.get("protocol", "?")
     media_type = _EXT_TO_MEDIA_TYPE.get(ext, "audio/mpeg")
-    print(f"   -> Format: {ext} via {protocol} ({media_type})")
+    proxy_log.debug("SoundCloud format: %s via %s (%s)", ext, protocol, media_type)
     return info["url"], media_type
 
+# SoundCloud CDN URLs are signed and short-lived: cache each resolution until the
+# expiry baked into its signature, and collapse concurrent clicks on one track.
+soundcloud_resolver = ResolverCache(
+    _resolve_soundcloud_url,
+    expiry_of=lambda resolved: signed_url_expiry(resolved[0]),
+)
+
+# /api/stations is served from a pre-serialized, pre-compressed snapshot that is
+# rebuilt only when an upsert bumps the stations version.
+station_snapshots = SnapshotCache(lambda: query_stations(limit=2000), stations_version)
+# The globe's compact columnar payload covers far more of the catalogue than
+# the JSON list, at a fraction of the bytes and none of the parsing
+COLUMNAR_STATION_LIMIT = int(os.getenv("COLUMNAR_STATION_LIMIT", "100000"))
+station_columns = SnapshotCache(lambda: query_stations(limit=COLUMNAR_STATION_LIMIT), stations_version,
+                                serialize=columnar_body, label="stations.bin")
+# Far-zoom viewport requests are answered from per-zoom grid clusters built
+# against the same version counter.
+station_clusters = ClusterIndex(iter_station_points, stations_version)
+
+# Close-zoom viewport requests return individual stations, capped per request
+VIEWPORT_STATION_LIMIT = 5000
+
+# Ingestion, health probes and the yt-dlp pre-warm all wait this long after
+# startup, so the first page loads are served from stations.db without
+# competing with them for the GIL and the database writer.
+STARTUP_DEFER = float(os.getenv("STARTUP_DEFER", "20"))
+# Import yt-dlp in the background once started (1), or on the first
+# SoundCloud/YouTube metadata lookup (0). The YouTube pipe runs it as a
+# subprocess and never needs the import.
+YTDLP_PREWARM = os.getenv("YTDLP_PREWARM", "1") != "0"
+
+# How often every worker checks stations.db for writes made by the leader
+STATIONS_VERSION_POLL = float(os.getenv("STATIONS_VERSION_POLL", "2"))
+
+async def _leader_work():
+    """Ingestion and health probes: run by exactly one worker, the lease holder."""
+    # Only sources whose refresh interval has elapsed are fetched, so a
+    # restart with fresh data costs no upstream traffic at all
+    tasks = [asyncio.create_task(refresh_scheduler.run_forever())]
+    if HEALTH_PROBES_ENABLED:
+        tasks.append(asyncio.create_task(health_prober.run_forever()))
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        # A run started by /api/refresh isn't owned by the scheduler loop;
+        # stop it too, or it would overlap with the next leader's
+        refresh_scheduler.cancel()
+
+async def _watch_stations_version():
+    """Rebuild this worker's cached payloads when another process changes the stations."""
+    while True:
+        await asyncio.sleep(STATIONS_VERSION_POLL)
+        try:
+            if await asyncio.to_thread(reload_stations_version):
+                await rebuild_payloads()
+        except Exception as e:
+            log.exception("Stations version check failed: %s", e)
+
+async def _deferred_election():
+    await asyncio.sleep(STARTUP_DEFER)
+    await ingestion_lease.run_forever()
+
+async def _deferred_prewarm():
+    await asyncio.sleep(STARTUP_DEFER)
+    started = time.monotonic()
+    try:
+        await asyncio.to_thread(importlib.import_module, "yt_dlp")
+    except Exception as e:
+        # Only costs the first SoundCloud/YouTube lookup its speed-up
+        log.warning("yt-dlp pre-warm failed: %s", e)
+        return
+    log.info("yt-dlp pre-warmed in %.2fs", time.monotonic() - started)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("🚀 Initializing Geo-Radio Services...")
-    asyncio.create_task(asyncio.to_thread(run_ingestion))
+    started = time.monotonic()
+    log.info("Initializing Geo-Radio services")
+    await asyncio.to_thread(init_db)
+    # Whatever the last run left in stations.db is served straight away
+    snapshot = await asyncio.to_thread(station_snapshots.current)
+    tasks = [
+        # Independent tasks: a failed pre-warm must not take the election down with it
+        asyncio.create_task(_deferred_election()),
+        asyncio.create_task(_watch_stations_version()),
+    ]
+    if YTDLP_PREWARM:
+        tasks.append(asyncio.create_task(_deferred_prewarm()))
+    log.info("Ready in %.2fs with %d stations; background work starts in %.0fs",
+             time.monotonic() - started, snapshot.count, STARTUP_DEFER)
     yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await close_http_client()
+    close_db()
 
 app = FastAPI(lifespan=lifespan)
 
 # --- THE ROBUST RADIO PROXY ---
 @app.get("/api/proxy")
 async def proxy_stream(url: str = Query(...)):
-    """A protocol-agnostic proxy that handles ICY, HTTP/1.0, HTTPS, and SoundCloud."""
-    media_type = "audio/mpeg"
+    """A protocol-agnostic proxy that handles ICY, HTTP/1.0, HTTPS, and SoundCloud.
+
+    Listeners of the same live station share one upstream connection: the
+    first listener opens a StreamHub, later ones just attach to it.
+    On-demand tracks (SoundCloud, YouTube videos) get a hub of their own per
+    listener, played from the start at the listener's pace.
+    """
+    key = normalize_stream_url(url)
+    live = is_live(url)
+    hub = hubs.get(key) if live else None
+    if hub:
+        proxy_log.debug("Joining live hub (%d listening): %.80s", hub.listeners, key)
 
     # ── YOUTUBE: pipe yt-dlp download directly (live streams are HLS-only) ──────
-    # YouTube live streams have no progressive HTTP format — HLS is the only option.
-    # Rather than proxying the manifest (which the browser can't parse), we let
-    # yt-dlp fetch and concatenate HLS segments internally and pipe raw audio out.
-    #
-    # asyncio.create_subprocess_exec is not supported on Windows SelectorEventLoop,
-    # so we run subprocess.Popen in a thread pool and bridge chunks via asyncio.Queue.
-    if "youtube.com" in url or "youtu.be" in url:
-        print(f"Streaming YouTube via yt-dlp pipe: {url[:80]}")
-
-        async def youtube_stream():
-            q: asyncio.Queue = asyncio.Queue()
-            loop = asyncio.get_running_loop()
-
-            def _pipe():
-                proc = subprocess.Popen(
-                    [
-                        "yt-dlp",
-                        # Format 91 = lowest-bandwidth HLS (144p, AAC audio track).
-                        # No audio-only formats exist for YouTube live streams —
-                        # all are HLS TS (video+audio). We pick 91 to minimise
-                        # bandwidth; Chrome's FFmpeg demuxer extracts the audio.
-                        "--format", "91/92/93/bestaudio",
-                        "--output", "-",
-                        "--quiet",
-                        "--no-playlist",
-                        "--js-runtimes", "node",
-                        url,
-                    ],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                )
-                try:
-                    while chunk := proc.stdout.read(4096):
-                        loop.call_soon_threadsafe(q.put_nowait, chunk)
-                finally:
-                    stderr_out = proc.stderr.read().decode(errors="replace").strip()
-                    if stderr_out:
-                        print(f"   -> yt-dlp stderr:\n{stderr_out[:1000]}")
-                    if proc.poll() is None:
-                        proc.kill()
-                    proc.wait()
-                    print(f"   -> yt-dlp pipe closed (rc={proc.returncode})")
-                    loop.call_soon_threadsafe(q.put_nowait, None)
-
-            pipe_task = loop.run_in_executor(None, _pipe)
-            try:
-                while (chunk := await q.get()) is not None:
-                    yield chunk
-            finally:
-                await pipe_task
-
-        return StreamingResponse(
-            youtube_stream(),
-            # TS container (MPEG-2 Transport Stream) — Chrome's FFmpeg demuxer
-            # can extract the AAC audio track from it via the <audio> element.
-            media_type="video/mp2t",
-            headers={"Access-Control-Allow-Origin": "*"},
-        )
-    # ─────────────────────────────────────────────────────────────────────────
+    elif stream_kind(url) == "youtube":
+        # The slot is taken here, not when the hub's pump first pulls, so
+        # concurrent tune-ins can't all slip past the cap
+        try:
+            stream_processes.reserve()
+        except ProcessLimitError:
+            log.warning("yt-dlp process cap reached (%d), refusing: %.80s", stream_processes.max_processes, url)
+            UPSTREAM_ERRORS.labels("youtube", "ProcessLimitError").inc()
+            return Response(status_code=503, headers={"Retry-After": "30"})
+        proxy_log.debug("Streaming YouTube via yt-dlp pipe: %.80s", url)
+        # TS container (MPEG-2 Transport Stream) — Chrome's FFmpeg demuxer
+        # can extract the AAC audio track from it via the <audio> element.
+        hub = hubs.create(key, "youtube", "video/mp2t", youtube_stream(url, reserved=True), live=live)
 
     # ── SOUNDCLOUD: resolve + stream via httpx (CDN uses HTTP/1.1 + redirects) ─
-    if "soundcloud.com" in url:
-        print(f"Resolving SoundCloud stream: {url}")
+    elif stream_kind(url) == "soundcloud":
+        proxy_log.debug("Resolving SoundCloud stream: %s", url)
         try:
-            cdn_url, media_type = await asyncio.to_thread(_resolve_soundcloud_url, url)
-            print(f"   -> Resolved to: {cdn_url[:80]}...")
+            cdn_url, media_type = await soundcloud_resolver.get(key)
+            proxy_log.debug("Resolved to: %.80s", cdn_url)
         except Exception as exc:
-            print(f"SoundCloud resolution failed: {exc}")
+            log.warning("SoundCloud resolution failed for %.80s: %s", url, exc)
+            UPSTREAM_ERRORS.labels("soundcloud", type(exc).__name__).inc()
             return Response(status_code=502)
+        # The resolution is shared through the cache; the CDN stream is not
+        hub = hubs.create(key, "soundcloud", media_type, soundcloud_stream(cdn_url), live=False)
 
-        async def soundcloud_stream():
-            async with httpx.AsyncClient(follow_redirects=True) as client:
-                async with client.stream("GET", cdn_url) as r:
-                    print(f"   -> CDN response: HTTP {r.status_code} | content-type: {r.headers.get('content-type', 'n/a')}")
-                    async for chunk in r.aiter_bytes(4096):
-                        yield chunk
-
-        return StreamingResponse(
-            soundcloud_stream(),
-            media_type=media_type,
-            headers={"Access-Control-Allow-Origin": "*"},
-        )
-    # ─────────────────────────────────────────────────────────────────────────
-
-    parsed = urlparse(url)
-    host = parsed.hostname
-    port = parsed.port or (443 if parsed.scheme == "https" else 80)
-    path = parsed.path + ("?" + parsed.query if parsed.query else "")
-    if not path: path = "/"
-
-    async def stream_generator():
-        reader, writer = None, None
-        try:
-            # Handle SSL for HTTPS streams, otherwise plain TCP
-            ssl_context = True if parsed.scheme == "https" else None
-            reader, writer = await asyncio.open_connection(host, port, ssl=ssl_context)
-
-            # Send a minimalist HTTP request
-            # We explicitly DON'T ask for ICY metadata to keep the stream clean
-            request = (
-                f"GET {path} HTTP/1.0\r\n"
-                f"Host: {host}\r\n"
-                f"User-Agent: MidnightRadio/1.0\r\n"
-                f"Accept: */*\r\n"
-                f"Connection: close\r\n\r\n"
-            )
-            writer.write(request.encode())
-            await writer.drain()
-
-            # Read and log upstream headers, then discard them
-            header_buffer = b""
-            while True:
-                line = await reader.readuntil(b"\n")
-                header_buffer += line
-                if header_buffer.endswith(b"\r\n\r\n") or header_buffer.endswith(b"\n\n"):
-                    break
-            raw_headers = header_buffer.decode(errors="replace")
-            status_line = raw_headers.splitlines()[0] if raw_headers else "(empty)"
-            ct = next((l.split(":", 1)[1].strip() for l in raw_headers.splitlines() if l.lower().startswith("content-type")), "n/a")
-            print(f"📡 TCP proxy upstream: {status_line} | content-type: {ct} | proxied as: {media_type}")
-
-            # Now just pipe the raw audio data
-            while True:
-                chunk = await reader.read(4096)
-                if not chunk: break
-                yield chunk
+    # ── ICY / HTTP(S): raw TCP pipe ──────────────────────────────────────────
+    else:
+        # Collapsed duplicates of this station (app/normalize.py) are failovers.
+        # Looked up first: nothing may be awaited between take() and the hub
+        # owning the connection, or a client leaving in between would leak it
+        fallbacks = await asyncio.to_thread(alternate_urls, url)
+        # Opened ahead of time by /api/prewarm, if the client hinted
+        preconnected = await preconnects.take(key)
+        hub = hubs.get(key)
+        if hub is None:
+            # Track titles ride along on the same connection (ICY metadata)
+            hub = hubs.create(key, "tcp", "audio/mpeg", tcp_stream(
+                url, on_title=partial(now_playing.publish, key),
+                fallbacks=fallbacks, preconnected=preconnected,
+            ))
+        elif preconnected is not None:
+            # Another listener opened the hub while we waited
+            await preconnected.close()
 
-        except Exception as e:
-            print(f"📡 Proxy Error: {e}")
-        finally:
-            if writer:
-                writer.close()
-                await writer.wait_closed()
-    
     return StreamingResponse(
-        stream_generator(),
-        media_type=media_type,
-        headers={"Access-Control-Allow-Origin": "*"}
+        hub.listen(),
+        media_type=hub.media_type,
+        headers={"Access-Control-Allow-Origin": "*"},
     )
 
+@app.post("/api/prewarm", status_code=202)
+async def prewarm(uuid: str = Query(...)):
+    """Hint that a station is about to be played, so its upstream is ready when /api/proxy asks.
+
+    ICY/HTTP(S) upstreams are connected and parked for PRECONNECT_TTL
+    seconds; SoundCloud tracks are resolved into the resolver cache. Best
+    effort and per worker: stations already live, YouTube (a yt-dlp process
+    per stream) and hints beyond PRECONNECT_MAX are left alone.
+    """
+    station = await asyncio.to_thread(get_station, uuid)
+    if station is None or not station["url"]:
+        return JSONResponse({"error": f"unknown station: {uuid}"}, status_code=404)
+    url = station["url"]
+    key = normalize_stream_url(url)
+    kind = stream_kind(url)
+    if hubs.get(key):
+        status = "live"
+    elif kind == "tcp":
+        status = "connecting" if preconnects.start(key, url) else "skipped"
+    elif kind == "soundcloud":
+        status = "resolving" if soundcloud_resolver.prefetch(key) else "skipped"
+    else:
+        status = "skipped"
+    return {"uuid": uuid, "kind": kind, "status": status}
+
+# --- NOW PLAYING ---
+def _now_playing_key(uuid: str) -> Optional[str]:
+    station = get_station(uuid)
+    return normalize_stream_url(station["url"]) if station and station["url"] else None
+
+def _now_playing_body(uuid: str, key: str, entry: Optional[Dict]) -> Dict:
+    return {
+        "uuid": uuid,
+        "title": entry["title"] if entry else None,
+        "updated_at": entry["updated_at"] if entry else None,
+        # Titles only flow while the station's upstream is open
+        "live": hubs.get(key) is not None,
+    }
+
+@app.get("/api/nowplaying/{uuid}")
+def get_now_playing(uuid: str):
+    """Latest ICY track title seen on this station's shared upstream."""
+    key = _now_playing_key(uuid)
+    if key is None:
+        return JSONResponse({"error": f"unknown station: {uuid}"}, status_code=404)
+    return _now_playing_body(uuid, key, now_playing.get(key))
+
+@app.get("/api/nowplaying/{uuid}/events")
+async def now_playing_events(uuid: str):
+    """Server-sent events: the current title, then one `nowplaying` event per track change."""
+    key = await asyncio.to_thread(_now_playing_key, uuid)
+    if key is None:
+        return JSONResponse({"error": f"unknown station: {uuid}"}, status_code=404)
+
+    def event(entry: Optional[Dict]) -> str:
+        return f"event: nowplaying\ndata: {json.dumps(_now_playing_body(uuid, key, entry))}\n\n"
+
+    async def events():
+        yield event(now_playing.get(key))
+        async for entry in now_playing.changes(key):
+            if entry is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield event(entry)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/stats")
+def get_stats():
+    """Live proxy state (shared upstreams, resolver cache, yt-dlp processes) and the last ingestion report."""
+    return {
+        "hubs": hubs.stats(),
+        "soundcloud_resolver": soundcloud_resolver.stats(),
+        "preconnects": preconnects.stats(),
+        "dns_cache": dns_cache.stats(),
+        "tls_sessions": tls_context.stats(),
+        "stream_processes": stream_processes.stats(),
+        "health_prober": health_prober.stats(),
+        "ingestion_lease": ingestion_lease.stats(),
+        "last_ingestion": latest_ingestion_run(),
+    }
+
+# --- METRICS ---
+# Live proxy state is read off the hubs and the process manager at scrape
+# time, so streaming a chunk never touches a metric.
+def _hub_totals(field: str):
+    return lambda: {(kind,): entry[field] for kind, entry in hubs.totals().items()}
+
+Gauge("georadio_proxy_active_streams", "Open shared upstreams.", ("kind",), collect=_hub_totals("streams"))
+Gauge("georadio_proxy_listeners", "Clients attached to an open upstream.", ("kind",), collect=_hub_totals("listeners"))
+Counter("georadio_proxy_bytes_total", "Audio bytes received from upstreams and fanned out to listeners.",
+        ("kind",), collect=_hub_totals("bytes_in"))
+Counter("georadio_upstream_preconnects_total", "Upstreams opened ahead of a listener, by outcome.", ("outcome",),
+        collect=lambda: {(o,): n for o, n in preconnects.stats().items() if o != "parked"})
+Counter("georadio_upstream_tls_handshakes_total", "TLS handshakes to ICY/HTTP(S) upstreams.", ("resumed",),
+        collect=lambda: {("true",): tls_context.resumed, ("false",): tls_context.full})
+Gauge("georadio_stream_processes", "Live yt-dlp stream subprocesses.",
+      collect=lambda: {(): stream_processes.active})
+Counter("georadio_stream_processes_spawned_total", "yt-dlp stream subprocesses started.",
+        collect=lambda: {(): stream_processes.spawned})
+Gauge("georadio_ingestion_leader", "1 if this worker holds the ingestion lease.",
+      collect=lambda: {(): int(ingestion_lease.is_leader)})
+
+@app.get("/api/metrics")
+def metrics():
+    """Proxy and ingestion metrics in Prometheus text format."""
+    return Response(content=REGISTRY.render(), media_type=REGISTRY.CONTENT_TYPE)
+
 # --- DATABASE & INGESTION ---
-def run_ingestion():
-    for _, name, is_pkg in pkgutil.iter_modules(parsers_package.__path__):
-        if is_pkg: continue
-        full_module_name = f"app.parsers.{name}"
-        try:
-            module = importlib.import_module(full_module_name)
-            for attr_name in dir(module):
-                attr = getattr(module, attr_name)
-                if isinstance(attr, type) and hasattr(attr, 'fetch_and_parse') and hasattr(attr, 'source_name'):
-                    parser_instance = attr()
-                    loop = asyncio.new_event_loop()
-                    try:
-                        stations = loop.run_until_complete(parser_instance.fetch_and_parse())
-                        if stations: upsert_stations(stations)
-                    finally:
-                        loop.close()
-        except Exception as e:
-            print(f"❌ Ingestion Error: {e}")
+async def rebuild_payloads(report: Optional[Dict] = None):
+    """After an ingestion run or a health change, build the new payloads now rather than on the next page load."""
+    await asyncio.to_thread(station_snapshots.current)
+    await asyncio.to_thread(station_columns.current)
+    await asyncio.to_thread(station_clusters.refresh)
+
+refresh_scheduler = RefreshScheduler(after_run=rebuild_payloads)
+# Dead or stalling upstreams drop out of every listing until they recover
+health_prober = HealthProber(on_visibility_change=rebuild_payloads)
+# With several workers (python -m app), only the lease holder runs the two above
+ingestion_lease = LeaderLease("ingestion", _leader_work)
+
+@app.post("/api/refresh")
+async def refresh(source: Optional[str] = None):
+    """Re-run ingestion now (all sources, or one by source_name).
+
+    Joins the run already in progress if it covers the source, or else
+    waits for a follow-up run once it ends, and returns the report. On a
+    worker that doesn't hold the ingestion lease the refresh is queued for
+    the worker that does, and the answer is 202 without a report.
+    """
+    parsers = None
+    if source is not None:
+        parsers = [p for p in discover_parsers() if p.source_name == source]
+        if not parsers:
+            return JSONResponse({"error": f"unknown source: {source}"}, status_code=404)
+    if not ingestion_lease.is_leader:
+        await asyncio.to_thread(request_refresh, source)
+        leader = await asyncio.to_thread(lease_holder, ingestion_lease.name)
+        return JSONResponse({"queued": True, "source": source, "leader": leader}, status_code=202)
+    return await refresh_scheduler.refresh(parsers)
 
 @app.get("/api/stations")
-def get_stations():
-    return query_stations(limit=2000)
+def get_stations(request: Request, bbox: Optional[str] = None, zoom: int = 0):
+    """Station list as cached bytes: gzip/brotli by Accept-Encoding, 304 on a matching ETag.
+
+    With `bbox=west,south,east,north` it becomes a viewport query instead:
+    cluster aggregates up to CLUSTER_MAX_ZOOM, individual stations beyond it.
+    """
+    if bbox is None:
+        return station_snapshots.respond(request.headers)
+
+    try:
+        box = parse_bbox(bbox)
+    except ValueError:
+        return JSONResponse({"error": "bbox must be west,south,east,north in degrees"}, status_code=400)
+
+    if zoom <= CLUSTER_MAX_ZOOM:
+        return {"mode": "clusters", "zoom": zoom, "items": station_clusters.clusters(zoom, box)}
+    items = query_stations_in_bbox(*box, limit=VIEWPORT_STATION_LIMIT)
+    return {
+        "mode": "stations",
+        "zoom": zoom,
+        "items": items,
+        "truncated": len(items) >= VIEWPORT_STATION_LIMIT,
+    }
+
+@app.get("/api/stations.bin")
+def get_stations_columnar(request: Request):
+    """Globe pins as packed columns (see app/snapshot.py), cached and conditional like /api/stations."""
+    return station_columns.respond(request.headers, media_type="application/octet-stream")
+
+@app.get("/api/stations/{uuid}")
+def get_station_record(uuid: str):
+    """One station's full record, for clients that loaded the columnar payload."""
+    station = get_station(uuid)
+    if station is None:
+        return JSONResponse({"error": f"unknown station: {uuid}"}, status_code=404)
+    return station
+
+@app.get("/api/search")
+def search(q: str = Query(..., min_length=1), bbox: Optional[str] = None,
+           limit: int = Query(50, ge=1, le=200)):
+    """Type-ahead search over name/tags/country (FTS5, bm25-ranked), optionally within a bbox."""
+    box = None
+    if bbox is not None:
+        try:
+            box = parse_bbox(bbox)
+        except ValueError:
+            return JSONResponse({"error": "bbox must be west,south,east,north in degrees"}, status_code=400)
+    return search_stations(q, box, limit)
 
 # Silence the favicon 404 logs
 @app.get("/favicon.ico")
@@ -243,5 +454,6 @@ dist_path = os.path.join(base_path, "dist")
 if os.path.exists(dist_path):
     app.mount("/", StaticFiles(directory=dist_path, html=True), name="static")
 
+# Development only (single process, auto-reload); production runs `python -m app`
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
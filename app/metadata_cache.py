@@ -0,0 +1,54 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+from app import database
+from app.metrics import YTDLP_RESOLVE_SECONDS
+
+log = logging.getLogger(__name__)
+
+
+def _cache_dir() -> str:
+    # Next to the database, so it lives on the same persistent volume
+    return os.getenv("METADATA_CACHE_DIR") or os.path.join(
+        os.path.dirname(database.DB_PATH) or ".", "metadata-cache"
+    )
+
+
+def cached_extract_info(url: str, ydl_opts: Dict, ttl: float) -> Optional[Dict]:
+    """yt-dlp `extract_info(download=False)` with a JSON file cache on disk.
+
+    Meant for the `extract_flat` metadata lookups done at ingestion time,
+    whose results (titles, ids, playlist entries) change rarely; a restart or
+    scheduled refresh within `ttl` seconds reuses them without any network.
+    Never use it for stream URL resolution — those URLs expire. Blocking.
+    """
+    key = hashlib.sha1(json.dumps([url, ydl_opts], sort_keys=True).encode()).hexdigest()
+    path = os.path.join(_cache_dir(), f"{key}.json")
+    try:
+        if time.time() - os.path.getmtime(path) < ttl:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    import yt_dlp   # deferred: hundreds of extractor modules, only needed on a cache miss
+
+    with YTDLP_RESOLVE_SECONDS.labels("metadata").time(), yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+        info = ydl.sanitize_info(info) if info is not None else None
+    if info is None:
+        return None
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(info, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        log.warning("Metadata cache write failed (%s): %s", path, e)
+    return info
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import math
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.broadcast import normalize_stream_url
+from app.database import dedupe_matches, iter_crowded_stations, reset_lone_positions, set_positions
+
+# Stations closer than this (degrees, ~100 m at the equator) share a grid
+# cell: that's "the same place" for both duplicate detection and spreading
+CELL_DEGREES = 0.001
+# Crowded cells are fanned out over a disc whose area grows with the number
+# of stations in it: radius = SPREAD_DEGREES * sqrt(count)
+SPREAD_DEGREES = 0.004
+# Coordinates are rounded to ~1 m so float noise never changes a content hash
+COORD_DECIMALS = 5
+
+_NAME_NOISE = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def url_key(url: str) -> str:
+    """Dedupe key for a stream URL: the hub key, minus the scheme.
+
+    http:// and https:// copies of one stream collapse into one station,
+    and the other copy is kept as an alternate.
+    """
+    return normalize_stream_url(url).split("://", 1)[-1]
+
+
+def _name_key(name: Optional[str]) -> str:
+    return _NAME_NOISE.sub(" ", (name or "").casefold()).strip()
+
+
+def _uuid_hash(uuid: str) -> Tuple[int, int]:
+    digest = hashlib.blake2b(uuid.encode(), digest_size=8).digest()
+    return int.from_bytes(digest[:4], "little"), int.from_bytes(digest[4:], "little")
+
+
+def _keyed_rows(stations: Sequence[Dict], by_place: bool) -> List[Dict]:
+    """Copies of `stations` with coordinates normalized and the dedupe columns set."""
+    rows = list({s["uuid"]: dict(s) for s in stations if s.get("uuid")}.values())
+    lat = np.array([r.get("lat") if r.get("lng") is not None else None for r in rows], dtype=np.float64)
+    lng = np.array([r.get("lng") if r.get("lat") is not None else None for r in rows], dtype=np.float64)
+    # + 0.0 turns -0.0 into 0.0, as SQLite stores it: the content hash must match the read-back row
+    lat = np.round(np.clip(lat, -90.0, 90.0), COORD_DECIMALS) + 0.0
+    lng = np.round((lng + 180.0) % 360.0 - 180.0, COORD_DECIMALS) + 0.0
+    has_geo = ~(np.isnan(lat) | np.isnan(lng))
+    # One non-negative integer per cell
+    cell = ((np.floor(np.nan_to_num(lat) / CELL_DEGREES) + 90_000) * 400_000
+            + np.floor(np.nan_to_num(lng) / CELL_DEGREES) + 180_000).astype(np.int64)
+
+    for i, row in enumerate(rows):
+        row["url_key"] = url_key(row["url"]) if row.get("url") else None
+        row["place_key"] = None
+        if has_geo[i]:
+            row["lat"] = row["raw_lat"] = float(lat[i])
+            row["lng"] = row["raw_lng"] = float(lng[i])
+            row["cell"] = int(cell[i])
+            name = _name_key(row.get("name"))
+            if by_place and name:
+                row["place_key"] = f"{row['cell']}:{name}"
+        else:
+            row["lat"] = row["lng"] = row["raw_lat"] = row["raw_lng"] = row["cell"] = None
+    return rows
+
+
+def _components(rows: List[Dict], columns: Sequence[str]) -> np.ndarray:
+    """For each row, the index of the first row in its duplicate group.
+
+    Rows are linked when any of `columns` holds the same non-null value, and
+    links chain (a shares a URL with b, b a place with c). Group minima are
+    propagated across every key, with pointer jumping, until nothing moves.
+    """
+    n = len(rows)
+    groupings = []
+    for column in columns:
+        members = np.array([i for i, r in enumerate(rows) if r[column] is not None], dtype=np.int64)
+        if len(members):
+            _, inverse = np.unique(np.array([rows[i][column] for i in members], dtype=object),
+                                   return_inverse=True)
+            groupings.append((members, inverse.ravel()))
+    root = np.arange(n)
+    while True:
+        before = root.copy()
+        for members, inverse in groupings:
+            low = np.full(inverse.max() + 1, n)
+            np.minimum.at(low, inverse, root[members])
+            root[members] = low[inverse]
+        while True:
+            jumped = root[root]
+            if (jumped == root).all(): break
+            root = jumped
+        if (root == before).all():
+            return root
+
+
+def _alt_list(value: Optional[str]) -> List[str]:
+    return json.loads(value) if value else []
+
+
+def normalize_batch(stations: Sequence[Dict], source: str, by_place: bool = True) -> Tuple[List[Dict], List[str]]:
+    """The ingestion stage between a parser batch and upsert_stations.
+
+    1. Coordinates are clamped/wrapped into range and rounded; the result is
+       also kept as raw_lat/raw_lng for spread_crowded_cells().
+    2. Stations of `source` with the same stream (url_key) or, with
+       `by_place`, the same name in the same grid cell are one station:
+       the one with the smallest uuid. Matches are looked up in this batch
+       and among the source's stored stations, so every batch can be
+       written as it arrives. The others' URLs, and the alternates they
+       already carried, become the survivor's `alt_urls`.
+
+    Returns (rows to upsert, uuids of collapsed duplicates to delete).
+    """
+    fresh = _keyed_rows(stations, by_place)
+    if not fresh:
+        return [], []
+    stored = dedupe_matches(
+        source,
+        sorted({r["url_key"] for r in fresh if r["url_key"]}),
+        sorted({r["place_key"] for r in fresh if r["place_key"]}),
+    )
+    # A station's own stored row is superseded, but its alternates carry over
+    carried = {s["uuid"]: _alt_list(s["alt_urls"]) for s in stored}
+    fresh_uuids = {r["uuid"] for r in fresh}
+    for row in fresh:
+        row["alt_urls"] = json.dumps(carried[row["uuid"]]) if carried.get(row["uuid"]) else None
+    nodes = sorted(fresh + [s for s in stored if s["uuid"] not in fresh_uuids], key=lambda r: r["uuid"])
+
+    root = _components(nodes, ("url_key", "place_key"))
+    alternates: Dict[int, List[str]] = {}
+    dropped: List[str] = []
+    for i in np.flatnonzero(root != np.arange(len(nodes))):
+        node, keep = nodes[i], int(root[i])
+        dropped.append(node["uuid"])
+        alternates.setdefault(keep, []).extend(([node["url"]] if node.get("url") else [])
+                                               + _alt_list(node["alt_urls"]))
+
+    rows = []
+    for i, node in enumerate(nodes):
+        if root[i] != i:
+            continue
+        is_fresh = node["uuid"] in fresh_uuids
+        if not is_fresh and i not in alternates:
+            continue    # stored, untouched by this batch
+        urls = sorted(set(_alt_list(node["alt_urls"]) + alternates.get(i, [])) - {node.get("url")})
+        node["alt_urls"] = json.dumps(urls) if urls else None
+        if not is_fresh:
+            # Rewritten for its new alternates: back to its own coordinates
+            # until the spread pass moves it again
+            node["lat"], node["lng"] = node["raw_lat"], node["raw_lng"]
+        rows.append(node)
+    return rows, dropped
+
+
+def spread_positions(uuids: Sequence[str], lat: np.ndarray, lng: np.ndarray,
+                     crowd: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Deterministic spots on a disc around each station's own position.
+
+    The disc's radius grows with sqrt(crowd); each station's place on it is
+    seeded from a hash of its uuid, so pins don't move between refreshes.
+    """
+    hashes = np.array([_uuid_hash(u) for u in uuids], dtype=np.float64).reshape(-1, 2)
+    u, v = hashes[:, 0] / 2.0 ** 32, hashes[:, 1] / 2.0 ** 32
+    # Uniform over the disc: sqrt on the radius keeps the centre from clumping
+    radius = SPREAD_DEGREES * np.sqrt(crowd) * np.sqrt(u)
+    theta = 2 * math.pi * v
+    out_lat = np.clip(lat + radius * np.cos(theta), -90.0, 90.0)
+    # Longitude degrees shrink towards the poles; keep the disc round on the globe
+    out_lng = lng + radius * np.sin(theta) / np.maximum(np.cos(np.radians(out_lat)), 0.01)
+    out_lng = (out_lng + 180.0) % 360.0 - 180.0
+    return np.round(out_lat, COORD_DECIMALS) + 0.0, np.round(out_lng, COORD_DECIMALS) + 0.0
+
+
+def spread_crowded_cells(chunk_size: int = 1000) -> int:
+    """Fan out every grid cell holding several stations (of any source); returns rows moved.
+
+    Runs after each parser's batches are written, chunk by chunk over the
+    crowded cells only. Positions depend on nothing but the uuid, the raw
+    coordinates and the cell's count, so a pass over unchanged data writes
+    nothing. Stations left alone in their cell go back to their raw position.
+    """
+    moved = reset_lone_positions()
+    for chunk in iter_crowded_stations(chunk_size):
+        uuids = [r[0] for r in chunk]
+        raw = np.array([r[1:3] for r in chunk], dtype=np.float64)
+        current = np.array([r[3:5] for r in chunk], dtype=np.float64)
+        crowd = np.array([r[5] for r in chunk], dtype=np.float64)
+        lat, lng = spread_positions(uuids, raw[:, 0], raw[:, 1], crowd)
+        stale = np.flatnonzero((lat != current[:, 0]) | (lng != current[:, 1]))
+        moved += set_positions([(float(lat[i]), float(lng[i]), uuids[i]) for i in stale])
+    return moved
@@ -0,0 +1,75 @@
+import asyncio
+import re
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Optional
+
+# StreamTitle='Artist - Title';StreamUrl='...'; — titles may themselves contain
+# quotes, so a value only ends at a quote followed by ';' and the next key or the end
+_STREAM_TITLE = re.compile(rb"StreamTitle='(.*?)';(?=\w+=|\s*$)", re.S)
+
+
+def parse_stream_title(block: bytes) -> Optional[str]:
+    """The StreamTitle out of one ICY metadata block (NUL padding included), or None."""
+    match = _STREAM_TITLE.search(block.rstrip(b"\0"))
+    if match is None:
+        return None
+    raw = match.group(1)
+    try:
+        return raw.decode("utf-8").strip()
+    except UnicodeDecodeError:
+        # Plenty of older Shoutcast servers still send Latin-1
+        return raw.decode("latin-1").strip()
+
+
+class NowPlaying:
+    """Latest ICY track title per stream, keyed like the hubs (normalized URL).
+
+    Titles arrive as a side effect of proxying — tcp_stream demuxes them out
+    of the same upstream connection the audio comes from — so a station
+    only has a title while somebody (or recently somebody) is listening.
+    """
+
+    MAX_ENTRIES = 1024
+
+    def __init__(self):
+        self._titles: "OrderedDict[str, Dict]" = OrderedDict()
+        self._wake: Optional[asyncio.Event] = None
+
+    def publish(self, key: str, title: str):
+        current = self._titles.get(key)
+        if current is not None and current["title"] == title:
+            return
+        self._titles[key] = {"title": title, "updated_at": time.time()}
+        self._titles.move_to_end(key)
+        while len(self._titles) > self.MAX_ENTRIES:
+            self._titles.popitem(last=False)
+        if self._wake is not None:
+            self._wake.set()
+            self._wake = None
+
+    def get(self, key: str) -> Optional[Dict]:
+        return self._titles.get(key)
+
+    async def changes(self, key: str, heartbeat: float = 15.0) -> AsyncIterator[Optional[Dict]]:
+        """Yield every new entry for `key` from now on.
+
+        Yields None every `heartbeat` seconds without a change, so callers can
+        keep an idle connection alive.
+        """
+        last = self.get(key)
+        while True:
+            entry = self.get(key)
+            if entry is not last:
+                last = entry
+                yield entry
+                continue
+            if self._wake is None:
+                self._wake = asyncio.Event()
+            try:
+                await asyncio.wait_for(self._wake.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                yield None
+
+
+now_playing = NowPlaying()
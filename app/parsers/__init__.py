@@ -0,0 +1,63 @@
+import asyncio
+import codecs
+import json
+import re
+from typing import Any, AsyncIterator, Callable, Iterable, List
+
+_JSON_DECODER = json.JSONDecoder()
+_ARRAY_SEPARATORS = re.compile(r"[\s,]*")
+# What may follow an array element; anything else (or the end of the buffer)
+# could be the rest of it, e.g. the digits of a number split across chunks
+_ELEMENT_END = re.compile(r"[\s,\]]")
+
+
+async def gather_bounded(items: Iterable[Any], fetch: Callable[[Any], Any],
+                         concurrency: int, item_timeout: float) -> List[Any]:
+    """Run blocking `fetch(item)` calls in worker threads, at most `concurrency` at once.
+
+    Results come back in input order. An item that raises or exceeds
+    `item_timeout` yields its exception instead of a result, so one slow
+    lookup can't hold up the rest. (A timed-out thread is abandoned, not
+    killed — yt-dlp calls can't be interrupted.)
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _one(item):
+        async with semaphore:
+            return await asyncio.wait_for(asyncio.to_thread(fetch, item), item_timeout)
+
+    return await asyncio.gather(*(_one(item) for item in items), return_exceptions=True)
+
+
+async def iter_json_array(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    """Yield the elements of a top-level JSON array as its bytes stream in.
+
+    Only the element currently being parsed is held in memory, so a response
+    with tens of thousands of objects costs one object's worth of buffer
+    rather than the whole decoded list.
+    """
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf, pos, opened = "", 0, False
+    async for chunk in chunks:
+        buf = buf[pos:] + utf8.decode(chunk)
+        pos = 0
+        while True:
+            pos = _ARRAY_SEPARATORS.match(buf, pos).end()
+            if pos >= len(buf):
+                break
+            if not opened:
+                if buf[pos] != "[":
+                    raise ValueError("expected a JSON array")
+                opened, pos = True, pos + 1
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                item, end = _JSON_DECODER.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break   # element continues in the next chunk
+            if not _ELEMENT_END.match(buf, end):
+                break   # may not be all of it: decode again with the next chunk
+            pos = end
+            yield item
+    raise ValueError("JSON array ended early")
@@ -1,37 +1,108 @@
-from typing import List, Dict
+from typing import AsyncIterator, Dict, List, Optional
+import asyncio
+import logging
 import httpx
-import json
+
+from app.connections import http_client
+from app.database import get_http_validators, save_http_validators
+from app.parsers import iter_json_array
+
+log = logging.getLogger(__name__)
+
 
 class RadioBrowserParser:
     source_name = "radio_browser_api"
 
     # URL to fetch (using a reliable mirror)
     # For local testing, you can swap this with a local file read
-    DATA_URL = "https://de1.api.radio-browser.info/json/stations/topclick/500"
+    DATA_URL = "https://de1.api.radio-browser.info/json/stations/search"
+
+    # The full catalogue is paged through PAGE_SIZE rows at a time and written
+    # in BATCH_SIZE transactions, so memory stays flat however big it gets.
+    PAGE_SIZE = 10000
+    BATCH_SIZE = 1000
+    # Whole-catalogue refreshes take minutes, not seconds
+    timeout = 1800.0
+    refresh_interval = 6 * 3600
+
+    def _page_params(self, offset: int) -> Dict:
+        return {
+            "offset": offset,
+            "limit": self.PAGE_SIZE,
+            "has_geo_info": "true",
+            "hidebroken": "true",
+            # A stable order keeps pages from shifting under us mid-refresh
+            "order": "name",
+        }
+
+    def _normalize(self, item: Dict) -> Optional[Dict]:
+        # Smart Sub-Parsing: Only take items with valid Geo data
+        if not (item.get('geo_lat') and item.get('geo_long')):
+            return None
+        try:
+            lat, lng = float(item['geo_lat']), float(item['geo_long'])
+        except (TypeError, ValueError):
+            return None
+        return {
+            "uuid": item.get('stationuuid'),
+            "name": (item.get('name') or '').strip(),
+            "url": item.get('url_resolved'),
+            "country": item.get('country'),
+            "tags": item.get('tags'),
+            "lat": lat,
+            "lng": lng,
+            "source": self.source_name
+        }
+
+    async def stream_batches(self) -> AsyncIterator[List[Dict]]:
+        """Yield normalized stations in BATCH_SIZE lists while the pages stream in."""
+        log.info("[%s] Streaming catalogue", self.source_name)
+        total = 0
+        offset = 0
+        client = http_client()
+        while True:
+            page_url = str(httpx.URL(self.DATA_URL, params=self._page_params(offset)))
+            # Conditional GET: an unchanged page costs a 304 and no parsing
+            validators = await asyncio.to_thread(get_http_validators, page_url)
+            headers = {}
+            if validators and validators["etag"]:
+                headers["If-None-Match"] = validators["etag"]
+            if validators and validators["last_modified"]:
+                headers["If-Modified-Since"] = validators["last_modified"]
+
+            page_rows = 0
+            batch: List[Dict] = []
+            async with client.stream("GET", page_url, headers=headers, timeout=60.0) as resp:
+                if resp.status_code == 304:
+                    page_rows = validators["rows"]
+                else:
+                    resp.raise_for_status()
+                    async for item in iter_json_array(resp.aiter_bytes()):
+                        page_rows += 1
+                        station = self._normalize(item)
+                        if station is None:
+                            continue
+                        batch.append(station)
+                        if len(batch) >= self.BATCH_SIZE:
+                            total += len(batch)
+                            yield batch
+                            batch = []
+                    etag, last_modified = resp.headers.get("etag"), resp.headers.get("last-modified")
+            if batch:
+                total += len(batch)
+                yield batch
+            if resp.status_code != 304:
+                # Only remember validators once the whole page has been handed over;
+                # ingestion commits each batch before pulling the next, so its rows are stored
+                await asyncio.to_thread(save_http_validators, page_url, etag, last_modified, page_rows)
+            else:
+                log.debug("[%s] Page at offset %d unchanged (304)", self.source_name, offset)
+            if page_rows < self.PAGE_SIZE:
+                break
+            offset += self.PAGE_SIZE
+        log.info("[%s] Parsed %d valid geo-stations", self.source_name, total)
 
     async def fetch_and_parse(self) -> List[Dict]:
-        print(f"[{self.source_name}] Fetching data...")
-        
-        # In a real scenario, we might page through results or read a local dump
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(self.DATA_URL)
-            data = resp.json()
-
-        parsed_stations = []
-        
-        for item in data:
-            # Smart Sub-Parsing: Only take items with valid Geo data
-            if item.get('geo_lat') and item.get('geo_long'):
-                parsed_stations.append({
-                    "uuid": item.get('stationuuid'),
-                    "name": item.get('name', '').strip(),
-                    "url": item.get('url_resolved'),
-                    "country": item.get('country'),
-                    "tags": item.get('tags'),
-                    "lat": float(item['geo_lat']),
-                    "lng": float(item['geo_long']),
-                    "source": self.source_name
-                })
-        
-        print(f"[{self.source_name}] Parsed {len(parsed_stations)} valid geo-stations.")
-        return parsed_stations
\ No newline at end of file
+        # Collects everything in memory; ingestion prefers stream_batches.
+        # Pages that answered 304 since the last ingest contribute nothing.
+        return [station async for batch in self.stream_batches() for station in batch]
@@ -1,6 +1,10 @@
 from typing import List, Dict
-import asyncio
-import yt_dlp
+import logging
+
+from app.metadata_cache import cached_extract_info
+from app.parsers import gather_bounded
+
+log = logging.getLogger(__name__)
 
 
 class SoundCloudCuratedParser:
@@ -31,6 +35,14 @@ class SoundCloudCuratedParser:
     ]
     # ──────────────────────────────────────────────────────────────────────────
 
+    CONCURRENCY = 4         # parallel yt-dlp lookups
+    ITEM_TIMEOUT = 60.0     # seconds per track before we give up on it
+    METADATA_TTL = 7 * 24 * 3600    # track titles/ids hardly ever change
+    refresh_interval = 24 * 3600
+    # Hand-picked tracks are distinct by construction: only identical URLs
+    # count as duplicates
+    dedupe_by_place = False
+
     _YDL_OPTS = {
         "quiet": True,
         "skip_download": True,
@@ -41,9 +53,10 @@ class SoundCloudCuratedParser:
     }
 
     def _fetch_metadata(self, item: Dict) -> Dict:
-        """Blocking yt-dlp metadata fetch — called via asyncio.to_thread."""
-        with yt_dlp.YoutubeDL(self._YDL_OPTS) as ydl:
-            info = ydl.extract_info(item["url"], download=False)
+        """Blocking yt-dlp metadata fetch (disk-cached) — called via asyncio.to_thread."""
+        info = cached_extract_info(item["url"], self._YDL_OPTS, self.METADATA_TTL)
+        if info is None:
+            raise ValueError("no metadata returned")
         return {
             "uuid": f"sc-{info.get('id', item['url'])}",
             "name": item.get("override_name") or info.get("title"),
@@ -56,14 +69,15 @@ class SoundCloudCuratedParser:
         }
 
     async def fetch_and_parse(self) -> List[Dict]:
-        print(f"[{self.source_name}] Processing {len(self.STATIONS)} curated tracks...")
+        log.info("[%s] Processing %d curated tracks", self.source_name, len(self.STATIONS))
+        outcomes = await gather_bounded(self.STATIONS, self._fetch_metadata,
+                                        self.CONCURRENCY, self.ITEM_TIMEOUT)
         results = []
-        for item in self.STATIONS:
-            try:
-                station = await asyncio.to_thread(self._fetch_metadata, item)
-                results.append(station)
-                print(f"   -> Found: {station['name']}")
-            except Exception as exc:
-                print(f"   -> Failed {item['url']}: {exc}")
-        print(f"[{self.source_name}] Parsed {len(results)} stations.")
+        for item, outcome in zip(self.STATIONS, outcomes):
+            if isinstance(outcome, BaseException):
+                log.warning("[%s] Failed %s: %r", self.source_name, item["url"], outcome)
+                continue
+            results.append(outcome)
+            log.debug("[%s] Found: %s", self.source_name, outcome["name"])
+        log.info("[%s] Parsed %d stations", self.source_name, len(results))
         return results
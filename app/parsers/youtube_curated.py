@@ -1,7 +1,10 @@
 from typing import List, Dict
-import asyncio
-import random
-import yt_dlp
+import logging
+
+from app.metadata_cache import cached_extract_info
+from app.parsers import gather_bounded
+
+log = logging.getLogger(__name__)
 
 
 class YoutubeParser:
@@ -26,6 +29,14 @@ class YoutubeParser:
     ]
     # ──────────────────────────────────────────────────────────────────────────
 
+    CONCURRENCY = 4         # parallel yt-dlp lookups
+    ITEM_TIMEOUT = 90.0     # seconds per source (playlists take longer) before we give up
+    METADATA_TTL = 24 * 3600        # playlists gain entries; refetch daily
+    refresh_interval = 12 * 3600
+    # Entries share the source's name and spot but are distinct streams:
+    # only identical URLs count as duplicates
+    dedupe_by_place = False
+
     _YDL_OPTS = {
         "quiet": True,
         "skip_download": True,
@@ -34,31 +45,32 @@ class YoutubeParser:
     }
 
     def _fetch_source(self, source: Dict) -> List[Dict]:
-        """Blocking yt-dlp metadata fetch — called via asyncio.to_thread."""
-        with yt_dlp.YoutubeDL(self._YDL_OPTS) as ydl:
-            info = ydl.extract_info(source["url"], download=False)
+        """Blocking yt-dlp metadata fetch (disk-cached) — called via asyncio.to_thread."""
+        info = cached_extract_info(source["url"], self._YDL_OPTS, self.METADATA_TTL)
 
         if info is None:
             return []
 
         if "entries" in info:
-            # Playlist — scatter up to 10 entries around the source coordinates
+            # Playlist — up to 10 entries, all at the source coordinates;
+            # ingestion spreads co-located stations apart
             return [
-                self._format_entry(entry, source, scatter=True)
+                self._format_entry(entry, source)
                 for entry in info["entries"][:10]
                 if entry
             ]
         else:
             return [self._format_entry(info, source)]
 
-    def _format_entry(self, info: Dict, source: Dict, scatter: bool = False) -> Dict:
-        lat = source["lat"] + (random.uniform(-0.05, 0.05) if scatter else 0)
-        lng = source["lng"] + (random.uniform(-0.05, 0.05) if scatter else 0)
-
+    def _format_entry(self, info: Dict, source: Dict) -> Dict:
         video_id = info.get("id", "")
-        # Construct a canonical watch URL from the video ID.
+        # Construct a canonical URL from the video ID.
         # extract_flat does not reliably populate info['url'] for single videos.
-        url = f"https://www.youtube.com/watch?v={video_id}" if video_id else source["url"]
+        # Live streams get the /live/ form: the proxy shares one upstream
+        # between their listeners, and streams videos to each on its own.
+        live = info.get("live_status") == "is_live" or bool(info.get("is_live"))
+        url = (f"https://www.youtube.com/{'live/' if live else 'watch?v='}{video_id}"
+               if video_id else source["url"])
 
         return {
             "uuid": f"yt-{video_id}",
@@ -66,21 +78,22 @@ class YoutubeParser:
             "url": url,
             "country": "YouTube",
             "tags": source.get("tags", "YouTube"),
-            "lat": lat,
-            "lng": lng,
+            "lat": source["lat"],
+            "lng": source["lng"],
             "source": self.source_name,
         }
 
     async def fetch_and_parse(self) -> List[Dict]:
-        print(f"[{self.source_name}] Processing {len(self.SOURCES)} YouTube sources...")
+        log.info("[%s] Processing %d YouTube sources", self.source_name, len(self.SOURCES))
+        outcomes = await gather_bounded(self.SOURCES, self._fetch_source,
+                                        self.CONCURRENCY, self.ITEM_TIMEOUT)
         results = []
-        for source in self.SOURCES:
-            try:
-                entries = await asyncio.to_thread(self._fetch_source, source)
-                results.extend(entries)
-                for e in entries:
-                    print(f"   -> Found: {e['name']} ({e['url']})")
-            except Exception as exc:
-                print(f"   -> Failed {source['url']}: {exc}")
-        print(f"[{self.source_name}] Parsed {len(results)} stations.")
-        return results
\ No newline at end of file
+        for source, outcome in zip(self.SOURCES, outcomes):
+            if isinstance(outcome, BaseException):
+                log.warning("[%s] Failed %s: %r", self.source_name, source["url"], outcome)
+                continue
+            results.extend(outcome)
+            for e in outcome:
+                log.debug("[%s] Found: %s (%s)", self.source_name, e["name"], e["url"])
+        log.info("[%s] Parsed %d stations", self.source_name, len(results))
+        return results
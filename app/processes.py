@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import os
+import subprocess
+from typing import AsyncIterator, Dict, List
+
+log = logging.getLogger("app.proxy")
+
+class ProcessLimitError(RuntimeError):
+    """Raised when starting another stream process would exceed the cap."""
+
+
+class StreamProcessManager:
+    """Runs stdout-streaming subprocesses (yt-dlp) with bounded buffering.
+
+    The asyncio subprocess pipe only reads ahead by about one chunk, so a
+    consumer that stops pulling fills the OS pipe and the child blocks on
+    write — memory stays flat no matter how slow the reader is. Closing the
+    generator (client gone, hub torn down) terminates the child immediately.
+
+    Event loops without subprocess support (Windows SelectorEventLoop, which
+    uvicorn uses under --reload) fall back to a Popen thread bridged through a
+    bounded queue, which gives the same backpressure at the cost of a thread.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+    QUEUE_CHUNKS = 8           # thread-bridge fallback: chunks buffered ahead of the consumer
+    STDERR_TAIL = 4096         # bytes of stderr kept for the exit log
+    KILL_TIMEOUT = 3.0         # seconds between SIGTERM and SIGKILL
+
+    def __init__(self, max_processes: int):
+        self.max_processes = max_processes
+        self.active = 0
+        self.spawned = 0
+        self.killed = 0        # processes stopped by us rather than exiting on their own
+
+    @property
+    def at_capacity(self) -> bool:
+        return self.active >= self.max_processes
+
+    def reserve(self):
+        """Claim a process slot now, for a stream(reserved=True) that starts later.
+
+        stream() only runs once its consumer first pulls from it, so callers
+        that must refuse up front (with a 503) reserve synchronously instead
+        of racing each other past `at_capacity`.
+        """
+        if self.at_capacity:
+            raise ProcessLimitError(f"{self.active}/{self.max_processes} stream processes running")
+        self.active += 1
+
+    async def stream(self, argv: List[str], reserved: bool = False) -> AsyncIterator[bytes]:
+        """Async generator of the process's stdout; kills the process when closed.
+
+        With `reserved`, the slot was already taken by reserve(); either way
+        it is given back when the generator finishes.
+        """
+        if not reserved:
+            self.reserve()
+        self.spawned += 1
+        chunks = None
+        try:
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    *argv,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    limit=self.CHUNK_SIZE,
+                )
+                chunks = self._stream_async(proc, argv)
+            except NotImplementedError:
+                chunks = self._stream_threaded(argv)
+
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            # Close the inner generator explicitly so the child dies now, not at GC time
+            if chunks is not None:
+                await chunks.aclose()
+            self.active -= 1
+
+    async def _stream_async(self, proc, argv: List[str]) -> AsyncIterator[bytes]:
+        stderr_tail = bytearray()
+
+        async def _drain_stderr():
+            # Keep stderr flowing so a chatty child can't block on a full pipe
+            while chunk := await proc.stderr.read(4096):
+                stderr_tail.extend(chunk)
+                del stderr_tail[:-self.STDERR_TAIL]
+
+        drain_task = asyncio.get_running_loop().create_task(_drain_stderr())
+        try:
+            while chunk := await proc.stdout.read(self.CHUNK_SIZE):
+                yield chunk
+        finally:
+            if proc.returncode is None:
+                self.killed += 1
+                proc.terminate()
+                try:
+                    await asyncio.wait_for(proc.wait(), self.KILL_TIMEOUT)
+                except asyncio.TimeoutError:
+                    proc.kill()
+                    await proc.wait()
+            drain_task.cancel()
+            stderr_out = stderr_tail.decode(errors="replace").strip()
+            if stderr_out:
+                log.warning("%s stderr:\n%s", os.path.basename(argv[0]), stderr_out[:1000])
+            log.debug("Stream process closed (rc=%s)", proc.returncode)
+
+    async def _stream_threaded(self, argv: List[str]) -> AsyncIterator[bytes]:
+        q: asyncio.Queue = asyncio.Queue(maxsize=self.QUEUE_CHUNKS)
+        loop = asyncio.get_running_loop()
+        proc = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        def _pipe():
+            try:
+                while chunk := proc.stdout.read1(self.CHUNK_SIZE):
+                    # Blocks this thread while the queue is full — that's the backpressure
+                    asyncio.run_coroutine_threadsafe(q.put(chunk), loop).result()
+            finally:
+                stderr_out = proc.stderr.read().decode(errors="replace").strip()
+                if stderr_out:
+                    log.warning("%s stderr:\n%s", os.path.basename(argv[0]), stderr_out[:1000])
+                asyncio.run_coroutine_threadsafe(q.put(None), loop).result()
+
+        pipe_task = loop.run_in_executor(None, _pipe)
+        try:
+            while (chunk := await q.get()) is not None:
+                yield chunk
+        finally:
+            if proc.poll() is None:
+                self.killed += 1
+                proc.kill()
+            # Unblock the pipe thread if it is parked on a full queue
+            while not pipe_task.done():
+                while not q.empty():
+                    q.get_nowait()
+                await asyncio.wait([pipe_task], timeout=0.1)
+            await asyncio.to_thread(proc.wait)
+            log.debug("Stream process closed (rc=%s)", proc.returncode)
+
+    def stats(self) -> Dict:
+        return {
+            "active": self.active,
+            "max": self.max_processes,
+            "spawned": self.spawned,
+            "killed": self.killed,
+        }
+
+
+stream_processes = StreamProcessManager(int(os.getenv("MAX_STREAM_PROCESSES", "8")))
@@ -0,0 +1,144 @@
+import asyncio
+import base64
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, Optional, Set
+from urllib.parse import urlparse, parse_qsl
+
+log = logging.getLogger(__name__)
+
+def signed_url_expiry(url: str) -> Optional[float]:
+    """Epoch seconds after which a signed CDN URL stops working, if it says so.
+
+    Understands plain `Expires=`/`expire=` params and CloudFront custom
+    policies (`Policy=`, CloudFront's URL-safe base64 of a JSON document),
+    which is what SoundCloud's progressive CDN URLs carry.
+    """
+    params = dict(parse_qsl(urlparse(url).query))
+    for name in ("Expires", "expires", "expire"):
+        if params.get(name, "").isdigit():
+            return float(params[name])
+
+    policy = params.get("Policy")
+    if policy:
+        try:
+            raw = policy.replace("-", "+").replace("_", "=").replace("~", "/")
+            doc = json.loads(base64.b64decode(raw))
+            return float(doc["Statement"][0]["Condition"]["DateLessThan"]["AWS:EpochTime"])
+        except (ValueError, KeyError, IndexError, TypeError):
+            return None
+    return None
+
+
+class ResolverCache:
+    """TTL cache with single-flight loading for slow, blocking URL resolvers.
+
+    `resolve(key)` runs in a worker thread on a miss. Concurrent misses for the
+    same key share one in-flight resolution. Entries live until the expiry
+    reported by `expiry_of(value)` (or `default_ttl`), and a hit inside the
+    final `refresh_margin` seconds kicks off a background re-resolve so that
+    popular keys never fall back to a cold miss.
+    """
+
+    def __init__(self, resolve: Callable[[str], Any],
+                 expiry_of: Callable[[Any], Optional[float]] = lambda value: None,
+                 default_ttl: float = 300.0, refresh_margin: float = 60.0,
+                 max_entries: int = 256):
+        self._resolve = resolve
+        self._expiry_of = expiry_of
+        self.default_ttl = default_ttl
+        self.refresh_margin = refresh_margin
+        self.max_entries = max_entries
+
+        self._entries: Dict[str, tuple] = {}          # key -> (value, expires_at)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._background: Set[asyncio.Task] = set()
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0      # misses that joined an already in-flight resolution
+        self.refreshes = 0
+        self.prefetches = 0
+        self.errors = 0
+
+    async def get(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        now = time.time()
+        if entry and entry[1] > now:
+            self.hits += 1
+            if entry[1] - now < self.refresh_margin and key not in self._inflight:
+                self._refresh_in_background(key)
+            return entry[0]
+
+        self.misses += 1
+        return await self._load(key)
+
+    def prefetch(self, key: str) -> bool:
+        """Start resolving `key` in the background, unless it is cached or already in flight."""
+        entry = self._entries.get(key)
+        if (entry and entry[1] > time.time()) or key in self._inflight:
+            return False
+        self.prefetches += 1
+        self._load_in_background(key)
+        return True
+
+    async def _load(self, key: str) -> Any:
+        task = self._inflight.get(key)
+        if task:
+            self.coalesced += 1
+        else:
+            task = asyncio.get_running_loop().create_task(self._resolve_and_store(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so one cancelled caller doesn't abort the resolution for the others
+        return await asyncio.shield(task)
+
+    async def _resolve_and_store(self, key: str) -> Any:
+        try:
+            value = await asyncio.to_thread(self._resolve, key)
+        except Exception:
+            self.errors += 1
+            raise
+        expires_at = self._expiry_of(value) or time.time() + self.default_ttl
+        self._entries[key] = (value, expires_at)
+        if len(self._entries) > self.max_entries:
+            self._evict()
+        return value
+
+    def _refresh_in_background(self, key: str):
+        self.refreshes += 1
+        self._load_in_background(key)
+
+    def _load_in_background(self, key: str):
+        async def _load():
+            try:
+                await self._load(key)
+            except Exception as exc:
+                log.warning("Background resolve failed for %.80s: %s", key, exc)
+
+        task = asyncio.get_running_loop().create_task(_load())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def _evict(self):
+        now = time.time()
+        for key in [k for k, (_, exp) in self._entries.items() if exp <= now]:
+            del self._entries[key]
+        # Still over budget: drop the entries closest to expiry
+        overflow = len(self._entries) - self.max_entries
+        if overflow > 0:
+            for key in sorted(self._entries, key=lambda k: self._entries[k][1])[:overflow]:
+                del self._entries[key]
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self._entries),
+            "in_flight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "refreshes": self.refreshes,
+            "prefetches": self.prefetches,
+            "errors": self.errors,
+        }
@@ -0,0 +1,168 @@
+import gzip
+import hashlib
+import json
+import logging
+import struct
+import sys
+import threading
+from array import array
+from typing import Callable, Dict, List, Optional
+
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # brotli is optional — gzip and identity still work without it
+    brotli = None
+
+log = logging.getLogger(__name__)
+
+class StationSnapshot:
+    """One version of a payload, serialized and compressed once up front."""
+
+    def __init__(self, version: int, body: bytes, count: int):
+        self.version = version
+        self.count = count
+        digest = hashlib.sha256(body).hexdigest()[:20]
+        # One strong ETag per representation, all sharing the content digest
+        self.variants: Dict[str, tuple] = {
+            "identity": (body, f'"{digest}"'),
+            "gzip": (gzip.compress(body, compresslevel=9, mtime=0), f'"{digest}-gz"'),
+        }
+        if brotli is not None:
+            self.variants["br"] = (brotli.compress(body, quality=9), f'"{digest}-br"')
+        self.digest = digest
+
+
+def _preferred_encoding(accept_encoding: str, available) -> str:
+    accepted = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token.strip().lower()] = q
+    for encoding in ("br", "gzip"):
+        if encoding in available and accepted.get(encoding, 0) > 0:
+            return encoding
+    return "identity"
+
+
+def json_body(rows: List[Dict], version: int) -> bytes:
+    return json.dumps(rows, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+# ── COLUMNAR STATIONS ────────────────────────────────────────────────────────
+# /api/stations.bin: everything the globe draws, as typed arrays the browser
+# can view in place (app/static/js/StationPayload.js). All little-endian:
+#
+#   header   magic "GRST", then u32 format, stations version, station count,
+#            string count, string bytes, reserved
+#   f32      lat[count], lng[count]
+#   u32      uuid[count], name[count], country[count], tags[count]
+#            (indices into the string table)
+#   u32      string offsets[string count + 1] into the UTF-8 blob
+#   u8       UTF-8 blob
+#
+# Every section length is a multiple of 4 up to the blob, so each array
+# starts 4-byte aligned. Names, countries and tags repeat a lot and are
+# stored once each; string 0 is "" and stands in for NULL.
+
+COLUMNAR_MAGIC = b"GRST"
+COLUMNAR_FORMAT = 1
+_COLUMNAR_HEADER = struct.Struct("<4s6I")
+COLUMNAR_STRING_FIELDS = ("uuid", "name", "country", "tags")
+
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+def columnar_body(rows: List[Dict], version: int) -> bytes:
+    strings: Dict[str, int] = {"": 0}
+    lat, lng = array("f"), array("f")
+    columns = {field: array("I") for field in COLUMNAR_STRING_FIELDS}
+    for row in rows:
+        lat.append(row["lat"])
+        lng.append(row["lng"])
+        for field, column in columns.items():
+            value = row[field] or ""
+            index = strings.get(value)
+            if index is None:
+                index = strings[value] = len(strings)
+            column.append(index)
+
+    offsets, blob = array("I", [0]), bytearray()
+    for value in strings:       # dicts keep insertion order: position == index
+        blob += value.encode()
+        offsets.append(len(blob))
+
+    header = _COLUMNAR_HEADER.pack(COLUMNAR_MAGIC, COLUMNAR_FORMAT, version, len(rows),
+                                   len(strings), len(blob), 0)
+    return b"".join([
+        header,
+        _little_endian(lat), _little_endian(lng),
+        *(_little_endian(columns[field]) for field in COLUMNAR_STRING_FIELDS),
+        _little_endian(offsets),
+        bytes(blob),
+    ])
+
+
+class SnapshotCache:
+    """Serves a DB-derived payload from memory, rebuilt only when data changes.
+
+    `build()` produces the payload rows and `serialize(rows, version)` turns
+    them into the response body (JSON unless told otherwise); `version()` is
+    a cheap, I/O-free version number (database.stations_version) that
+    changes whenever the rows would. Requests in between are a dict lookup
+    and a memory copy.
+    """
+
+    CACHE_CONTROL = "public, max-age=0, must-revalidate"
+
+    def __init__(self, build: Callable[[], List[Dict]], version: Callable[[], int],
+                 serialize: Callable[[List[Dict], int], bytes] = json_body, label: str = "stations"):
+        self._build = build
+        self._version = version
+        self._serialize = serialize
+        self.label = label
+        self._snapshot: Optional[StationSnapshot] = None
+        self._lock = threading.Lock()
+
+    def current(self) -> StationSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == self._version():
+            return snapshot
+        with self._lock:
+            version = self._version()
+            if self._snapshot is None or self._snapshot.version != version:
+                rows = self._build()
+                self._snapshot = StationSnapshot(version, self._serialize(rows, version), len(rows))
+                log.info("Snapshot %s v%d: %d stations, %s", self.label, version, len(rows),
+                         ", ".join(f"{enc} {len(b) // 1024} KB" for enc, (b, _) in self._snapshot.variants.items()))
+            return self._snapshot
+
+    def respond(self, headers, media_type: str = "application/json") -> Response:
+        """Conditional, content-negotiated response for the current snapshot."""
+        snapshot = self.current()
+        encoding = _preferred_encoding(headers.get("accept-encoding", ""), snapshot.variants)
+        body, etag = snapshot.variants[encoding]
+        response_headers = {
+            "ETag": etag,
+            "Cache-Control": self.CACHE_CONTROL,
+            "Vary": "Accept-Encoding",
+        }
+
+        # Any representation of this version satisfies the client's cached copy
+        if_none_match = headers.get("if-none-match", "")
+        if if_none_match.strip() == "*" or snapshot.digest in if_none_match:
+            return Response(status_code=304, headers=response_headers)
+
+        if encoding != "identity":
+            response_headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type=media_type, headers=response_headers)
@@ -0,0 +1,99 @@
+import logging
+import math
+import threading
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Zoom levels at or below this are answered with clusters, above it with stations
+CLUSTER_MAX_ZOOM = 5
+# Grid cell edge at zoom 0, in degrees; halves with every zoom level
+BASE_CELL_DEGREES = 45.0
+TOP_TAGS = 3
+
+BBox = Tuple[float, float, float, float]   # (west, south, east, north)
+
+log = logging.getLogger(__name__)
+
+
+def parse_bbox(raw: str) -> BBox:
+    """Parse `west,south,east,north`. Raises ValueError on anything else."""
+    west, south, east, north = (float(v) for v in raw.split(","))
+    if not (-180 <= west <= 180 and -180 <= east <= 180 and -90 <= south <= north <= 90):
+        raise ValueError(f"bbox out of range: {raw}")
+    return west, south, east, north
+
+
+def cell_degrees(zoom: int) -> float:
+    return BASE_CELL_DEGREES / (2 ** zoom)
+
+
+def _in_bbox(lat: float, lng: float, bbox: BBox) -> bool:
+    west, south, east, north = bbox
+    if not south <= lat <= north:
+        return False
+    return west <= lng <= east if west <= east else (lng >= west or lng <= east)
+
+
+class ClusterIndex:
+    """Grid cluster aggregates for every zoom level up to CLUSTER_MAX_ZOOM.
+
+    All levels are built in a single pass over the station points whenever
+    `version()` moves, so a far-zoom viewport request is a filter over at most
+    a few thousand precomputed cells regardless of catalogue size.
+    """
+
+    def __init__(self, load_points: Callable[[], Iterable[Tuple[float, float, Optional[str]]]],
+                 version: Callable[[], int]):
+        self._load_points = load_points
+        self._version = version
+        self._built_version: Optional[int] = None
+        self._levels: List[List[Dict]] = []
+        self._lock = threading.Lock()
+
+    def _levels_for_current_version(self) -> List[List[Dict]]:
+        if self._built_version == self._version():
+            return self._levels
+        with self._lock:
+            version = self._version()
+            if self._built_version != version:
+                self._levels = self._build()
+                self._built_version = version
+                log.info("Cluster index v%d: %s", version,
+                         ", ".join(f"z{z}={len(cells)}" for z, cells in enumerate(self._levels)))
+            return self._levels
+
+    def _build(self) -> List[List[Dict]]:
+        # cells[zoom][(row, col)] = [count, sum_lat, sum_lng, tag Counter]
+        cells: List[Dict[Tuple[int, int], list]] = [{} for _ in range(CLUSTER_MAX_ZOOM + 1)]
+        sizes = [cell_degrees(z) for z in range(CLUSTER_MAX_ZOOM + 1)]
+        for lat, lng, tags in self._load_points():
+            tag_list = [t.strip().lower() for t in (tags or "").split(",") if t.strip()]
+            for zoom, size in enumerate(sizes):
+                key = (math.floor((lat + 90) / size), math.floor((lng + 180) / size))
+                cell = cells[zoom].get(key)
+                if cell is None:
+                    cell = cells[zoom][key] = [0, 0.0, 0.0, Counter()]
+                cell[0] += 1
+                cell[1] += lat
+                cell[2] += lng
+                cell[3].update(tag_list)
+
+        return [
+            [
+                {
+                    "count": count,
+                    "lat": round(sum_lat / count, 5),
+                    "lng": round(sum_lng / count, 5),
+                    "top_tags": [tag for tag, _ in tag_counts.most_common(TOP_TAGS)],
+                }
+                for count, sum_lat, sum_lng, tag_counts in level.values()
+            ]
+            for level in cells
+        ]
+
+    def clusters(self, zoom: int, bbox: BBox) -> List[Dict]:
+        level = self._levels_for_current_version()[max(0, min(zoom, CLUSTER_MAX_ZOOM))]
+        return [c for c in level if _in_bbox(c["lat"], c["lng"], bbox)]
+
+    def refresh(self):
+        self._levels_for_current_version()
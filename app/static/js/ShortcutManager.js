@@ -1,3 +1,5 @@
+import { withDetails } from './StationPayload.js';
+
 export class ShortcutManager {
     constructor(audioManager, uiManager) {
         this._audio = audioManager;
@@ -30,6 +32,6 @@ export class ShortcutManager {
     _togglePlayback() {
         const station = this._ui.currentStation;
         if (!station) return;
-        this._audio.toggle(station.url);
+        withDetails(station).then(s => this._audio.toggle(s.url));
     }
 }
@@ -0,0 +1,62 @@
+// Decoder for /api/stations.bin — the columnar station layout written by
+// columnar_body() in app/snapshot.py. Coordinates and string indices are
+// viewed in place over the response buffer; each distinct string is decoded
+// once, however many stations share it.
+
+const MAGIC  = 'GRST';
+const FORMAT = 1;
+const HEADER_BYTES = 28;
+const STRING_FIELDS = ['uuid', 'name', 'country', 'tags'];
+
+export function decodeStations(buffer) {
+    const header = new DataView(buffer, 0, HEADER_BYTES);
+    const magic  = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== MAGIC || header.getUint32(4, true) !== FORMAT) {
+        throw new Error(`unsupported station payload (${magic} v${header.getUint32(4, true)})`);
+    }
+    const count       = header.getUint32(12, true);
+    const stringCount = header.getUint32(16, true);
+
+    let offset = HEADER_BYTES;
+    const take = (Type, length) => {
+        const view = new Type(buffer, offset, length);
+        offset += length * Type.BYTES_PER_ELEMENT;
+        return view;
+    };
+    const lat = take(Float32Array, count);
+    const lng = take(Float32Array, count);
+    const columns = STRING_FIELDS.map(() => take(Uint32Array, count));
+    const stringOffsets = take(Uint32Array, stringCount + 1);
+    const blob = new Uint8Array(buffer, offset);
+
+    const utf8 = new TextDecoder();
+    const strings = new Array(stringCount);
+    for (let i = 0; i < stringCount; i++) {
+        strings[i] = utf8.decode(blob.subarray(stringOffsets[i], stringOffsets[i + 1]));
+    }
+
+    // Only what the globe and the details panel header need; url and the
+    // rest come from /api/stations/{uuid} when a station is selected
+    const stations = new Array(count);
+    for (let i = 0; i < count; i++) {
+        const station = { lat: lat[i], lng: lng[i] };
+        for (let f = 0; f < STRING_FIELDS.length; f++) {
+            station[STRING_FIELDS[f]] = strings[columns[f][i]] || null;
+        }
+        stations[i] = station;
+    }
+    return stations;
+}
+
+// Stations decoded from /api/stations.bin have no url yet: fetch the full
+// record the first time one is needed. Mutates the station in place, so
+// every reference (globe, UI, scan) sees the url once it arrives.
+export async function withDetails(station) {
+    if (station.url !== undefined) return station;
+    station._details ??= fetch(`/api/stations/${encodeURIComponent(station.uuid)}`)
+        .then(res => res.ok ? res.json() : {})
+        .then(record => Object.assign(station, record))
+        .catch(err => console.error('Failed to load station details:', err));
+    await station._details;
+    return station;
+}
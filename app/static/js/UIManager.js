@@ -1,3 +1,5 @@
+import { withDetails } from './StationPayload.js';
+
 export class UIManager {
     constructor(globeManager, audioManager, storageManager, settingsManager) {
         this.globe    = globeManager;
@@ -31,6 +33,9 @@ export class UIManager {
         // Search navigation state
         this._filteredResults = [];
         this._searchIndex     = 0;
+        this._searchSeq       = 0;    // guards against out-of-order search responses
+        this._stationsByUuid  = null; // uuid -> loaded station, rebuilt when the list changes
+        this._indexedStations = null;
 
         this._onCustomStationChange = null;
         this._cancelPick           = null;
@@ -77,25 +82,7 @@ export class UIManager {
         let searchTimer = null;
         this.elSearch.addEventListener('input', (e) => {
             clearTimeout(searchTimer);
-            searchTimer = setTimeout(() => {
-                const val = e.target.value.toLowerCase().trim();
-                if (!val) {
-                    this._filteredResults = [];
-                    this._searchIndex = 0;
-                    this.globe.setVisibleStations(this.globe.stations);
-                    this._updateSearchNav();
-                    return;
-                }
-                this._filteredResults = this.globe.stations.filter(s =>
-                    (s.name    || '').toLowerCase().includes(val) ||
-                    (s.tags    || '').toLowerCase().includes(val) ||
-                    (s.country || '').toLowerCase().includes(val)
-                );
-                this._searchIndex = 0;
-                this.globe.setVisibleStations(this._filteredResults);
-                if (this._filteredResults.length > 0) this._searchNavigate(0);
-                this._updateSearchNav();
-            }, 150);
+            searchTimer = setTimeout(() => this._runSearch(e.target.value.toLowerCase().trim()), 150);
         });
 
         this.elSearchPrev.addEventListener('click', () => {
@@ -109,9 +96,12 @@ export class UIManager {
         // Star / favorite
         this.elStarBtn.addEventListener('click', () => {
             if (!this.currentStation) return;
-            const isFav = this.storage.toggle(this.currentStation);
-            this._renderStarBtn(isFav);
-            this.globe.refreshPointColors();
+            // The favorite is stored with its url, which columnar stations only get from withDetails
+            withDetails(this.currentStation).then(station => {
+                const isFav = this.storage.toggle(station);
+                this._renderStarBtn(isFav);
+                this.globe.refreshPointColors();
+            });
         });
 
         // Scan toggle
@@ -320,6 +310,51 @@ export class UIManager {
             this._searchNavigate(this._searchIndex + 1);
     }
 
+    // Server-side FTS search (/api/search) for API stations, local filter for
+    // custom stations, which only exist in this browser. Falls back to the old
+    // in-memory filter if the request fails.
+    async _runSearch(val) {
+        const seq = ++this._searchSeq;
+        if (!val) {
+            this._filteredResults = [];
+            this._searchIndex = 0;
+            this.globe.setVisibleStations(this.globe.stations);
+            this._updateSearchNav();
+            return;
+        }
+
+        const matches = s =>
+            (s.name    || '').toLowerCase().includes(val) ||
+            (s.tags    || '').toLowerCase().includes(val) ||
+            (s.country || '').toLowerCase().includes(val);
+
+        let results;
+        try {
+            const res = await fetch(`/api/search?q=${encodeURIComponent(val)}&limit=200`);
+            if (!res.ok) throw new Error(`HTTP ${res.status}`);
+            const remote = await res.json();
+            // Reuse the loaded station objects so selection/favorite state lines up
+            if (this._indexedStations !== this.globe.stations) {
+                this._indexedStations = this.globe.stations;
+                this._stationsByUuid  = new Map(this.globe.stations.map(s => [s.uuid, s]));
+            }
+            results = [
+                ...this.storage.getCustomStations().filter(matches),
+                ...remote.map(s => this._stationsByUuid.get(s.uuid) || s),
+            ];
+        } catch (err) {
+            console.warn('Search API unavailable, filtering locally:', err);
+            results = this.globe.stations.filter(matches);
+        }
+        if (seq !== this._searchSeq) return; // a newer keystroke already ran
+
+        this._filteredResults = results;
+        this._searchIndex = 0;
+        this.globe.setVisibleStations(this._filteredResults);
+        if (this._filteredResults.length > 0) this._searchNavigate(0);
+        this._updateSearchNav();
+    }
+
     _searchNavigate(idx) {
         this._searchIndex = idx;
         // Re-use the full onStationSelect chain so selectedStation in main.js stays in sync
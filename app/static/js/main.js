@@ -5,6 +5,7 @@ import { StorageManager }    from './StorageManager.js';
 import { SettingsManager }   from './SettingsManager.js';
 import { VisualizerManager } from './VisualizerManager.js';
 import { ShortcutManager }   from './ShortcutManager.js';
+import { decodeStations, withDetails } from './StationPayload.js';
 
 // Application state
 let selectedStation = null;
@@ -12,6 +13,14 @@ let _apiStations    = [];   // kept in memory so custom-station changes can re-m
 
 const storageMgr = new StorageManager();
 
+// Tell the server a station is likely to be played next, so its upstream is
+// already connected when /api/proxy asks. Fire-and-forget: purely a hint.
+const prewarm = (station) => {
+    if (!station?.uuid) return;
+    fetch(`/api/prewarm?uuid=${encodeURIComponent(station.uuid)}`, { method: 'POST' })
+        .catch(() => {});
+};
+
 const audioMgr = new AudioManager((isPlaying, statusText) => {
     uiMgr.updateStatus(isPlaying, statusText);
     // Keep playing pin in sync with audio state
@@ -25,6 +34,8 @@ const globeMgr = new GlobeManager(
         uiMgr.showStation(station);
         globeMgr.focus(station.lat, station.lng);
         globeMgr.setSelected(station.uuid);
+        prewarm(station);
+        withDetails(station);
     },
     (uuid) => storageMgr.isFavorite(uuid)
 );
@@ -40,12 +51,12 @@ uiMgr.setScanAdvanceCallback(() => {
     uiMgr.showStation(station);
     globeMgr.focus(station.lat, station.lng);
     globeMgr.setSelected(station.uuid);
-    audioMgr.play(station.url);
+    withDetails(station).then(s => audioMgr.play(s.url));
 });
 
 // Play button
 document.getElementById('play-btn').addEventListener('click', () => {
-    if (selectedStation) audioMgr.toggle(selectedStation.url);
+    if (selectedStation) withDetails(selectedStation).then(s => audioMgr.toggle(s.url));
 });
 
 // Init
@@ -70,8 +81,17 @@ const refreshStations = () =>
 
 uiMgr.setCustomStationCallback(refreshStations);
 
-fetch('/api/stations')
-    .then(res => res.json())
+// Compact columnar payload first; the JSON list is the fallback
+fetch('/api/stations.bin')
+    .then(res => {
+        if (!res.ok) throw new Error(`HTTP ${res.status}`);
+        return res.arrayBuffer();
+    })
+    .then(decodeStations)
+    .catch(err => {
+        console.warn('Columnar stations unavailable, falling back to JSON:', err);
+        return fetch('/api/stations').then(res => res.json());
+    })
     .then(data => {
         _apiStations = data;
         console.log(`Loaded ${data.length} stations`);
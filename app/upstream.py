@@ -0,0 +1,354 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, Optional, Sequence
+from urllib.parse import urlparse
+
+from app.connections import http_client, open_connection, tls_context
+from app.metrics import UPSTREAM_ERRORS
+from app.nowplaying import parse_stream_title
+from app.processes import stream_processes
+
+log = logging.getLogger("app.proxy")
+
+YTDLP_BINARY = os.getenv("YTDLP_BINARY", "yt-dlp")
+# Bytes per upstream read for the HTTP readers; bench/proxy_bench.py compares sizes
+PROXY_CHUNK_SIZE = int(os.getenv("PROXY_CHUNK_SIZE", "4096"))
+# A pre-connected upstream (/api/prewarm) unclaimed after this long is closed
+PRECONNECT_TTL = float(os.getenv("PRECONNECT_TTL", "10"))
+PRECONNECT_MAX = int(os.getenv("PRECONNECT_MAX", "32"))
+
+
+# ── UPSTREAM READERS ─────────────────────────────────────────────────────────
+# Each reader is an async generator of raw audio chunks for a single upstream
+# connection. /api/proxy never hands these to a client directly — they feed a
+# StreamHub (app/broadcast.py), which fans the chunks out to every listener.
+
+def youtube_stream(url: str, reserved: bool = False):
+    """Pipe a yt-dlp download of a YouTube stream (live streams are HLS-only).
+
+    YouTube live streams have no progressive HTTP format — HLS is the only option.
+    Rather than proxying the manifest (which the browser can't parse), we let
+    yt-dlp fetch and concatenate HLS segments internally and pipe raw audio out.
+    The process itself is owned by stream_processes (app/processes.py);
+    `reserved` means the caller already took its slot with reserve().
+    """
+    argv = [
+        YTDLP_BINARY,
+        # Format 91 = lowest-bandwidth HLS (144p, AAC audio track).
+        # No audio-only formats exist for YouTube live streams —
+        # all are HLS TS (video+audio). We pick 91 to minimise
+        # bandwidth; Chrome's FFmpeg demuxer extracts the audio.
+        "--format", "91/92/93/bestaudio",
+        "--output", "-",
+        "--quiet",
+        "--no-playlist",
+        "--js-runtimes", "node",
+        url,
+    ]
+    return stream_processes.stream(argv, reserved=reserved)
+
+
+async def soundcloud_stream(cdn_url: str):
+    """Stream a resolved SoundCloud CDN URL via httpx (CDN uses HTTP/1.1 + redirects)."""
+    # The shared client keeps the CDN connection warm for the next track
+    async with http_client().stream("GET", cdn_url, follow_redirects=True) as r:
+        log.debug("CDN response: HTTP %d | content-type: %s", r.status_code, r.headers.get("content-type", "n/a"))
+        async for chunk in r.aiter_bytes(PROXY_CHUNK_SIZE):
+            yield chunk
+
+
+def stream_kind(url: str) -> str:
+    """Which upstream reader serves a URL: "youtube", "soundcloud" or "tcp"."""
+    if "youtube.com" in url or "youtu.be" in url:
+        return "youtube"
+    if "soundcloud.com" in url:
+        return "soundcloud"
+    return "tcp"
+
+
+def is_live(url: str) -> bool:
+    """Whether a URL is a broadcast that listeners can join midway (one shared hub).
+
+    ICY/HTTP(S) radio always is; SoundCloud tracks never are. YouTube
+    streams count as live only in their youtube.com/live/<id> form, which
+    the curated parser writes for live entries: a video played as a live
+    one would make later listeners start midway and skip ahead.
+    """
+    kind = stream_kind(url)
+    if kind == "youtube":
+        return urlparse(url).path.startswith("/live/")
+    return kind == "tcp"
+
+
+class UpstreamResponse:
+    """An open ICY/HTTP-1.0 upstream whose headers have been read."""
+
+    def __init__(self, reader, writer, status_line: str, headers: Dict[str, str], connect_time: float):
+        self.reader = reader
+        self.writer = writer
+        self.status_line = status_line
+        self.headers = headers              # lower-cased names
+        self.connect_time = connect_time    # seconds spent in DNS + TCP (+ TLS)
+
+    @property
+    def status(self) -> int:
+        # "ICY 200 OK" and "HTTP/1.0 200 OK" both carry the code second
+        parts = self.status_line.split()
+        return int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def open_upstream(url: str, icy_metadata: bool = False) -> UpstreamResponse:
+    """Connect, send a minimal HTTP/1.0 request and read the upstream headers.
+
+    Shared by the proxy (tcp_stream) and the health prober, so both see the
+    exact handshake a listener would get. With `icy_metadata` the server is
+    asked to interleave track metadata every `icy-metaint` bytes.
+    """
+    parsed = urlparse(url)
+    host = parsed.hostname
+    port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    path = parsed.path + ("?" + parsed.query if parsed.query else "")
+    if not path: path = "/"
+
+    started = time.monotonic()
+    # TLS for HTTPS streams, otherwise plain TCP; DNS answers and TLS
+    # sessions are cached across connections (app/connections.py)
+    tls = parsed.scheme == "https"
+    reader, writer = await open_connection(host, port, tls)
+    connect_time = time.monotonic() - started
+
+    try:
+        # Send a minimalist HTTP request
+        request = (
+            f"GET {path} HTTP/1.0\r\n"
+            f"Host: {host}\r\n"
+            f"User-Agent: MidnightRadio/1.0\r\n"
+            f"Accept: */*\r\n"
+            + ("Icy-MetaData: 1\r\n" if icy_metadata else "")
+            + "Connection: close\r\n\r\n"
+        )
+        writer.write(request.encode())
+        await writer.drain()
+
+        # Read the upstream headers, up to the blank line (CRLF or bare LF)
+        header_lines = []
+        while True:
+            line = await reader.readuntil(b"\n")
+            if line in (b"\r\n", b"\n"):
+                break
+            header_lines.append(line)
+    except BaseException:
+        writer.close()
+        raise
+    if tls:
+        tls_context.remember(writer.get_extra_info("ssl_object"))
+
+    lines = b"".join(header_lines).decode(errors="replace").splitlines()
+    status_line = lines[0] if lines else "(empty)"
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return UpstreamResponse(reader, writer, status_line, headers, connect_time)
+
+
+async def _demux_icy(reader, metaint: int, on_title: Callable[[str], None]):
+    """Audio out of an ICY stream with inline metadata, metadata blocks cut out.
+
+    Every `metaint` audio bytes the server inserts one length byte (x16) and
+    that many bytes of metadata. Reads are sliced with memoryview, so audio
+    is never copied: a read that holds only audio is passed through as is,
+    and one that straddles a block becomes two zero-copy views.
+    """
+    audio_left = metaint        # audio bytes until the next length byte
+    meta_left = -1              # metadata bytes still to read; -1: not inside a block
+    meta = bytearray()
+    while True:
+        data = await reader.read(PROXY_CHUNK_SIZE)
+        if not data: break
+        size = len(data)
+        if audio_left >= size:
+            # The hot path: the whole read is audio
+            audio_left -= size
+            yield data
+            continue
+        view = memoryview(data)
+        pos = 0
+        while pos < size:
+            if audio_left:
+                end = min(size, pos + audio_left)
+                audio_left -= end - pos
+                yield view[pos:end]
+                pos = end
+            elif meta_left < 0:
+                meta_left = view[pos] * 16
+                pos += 1
+                if meta_left == 0:
+                    meta_left, audio_left = -1, metaint
+            else:
+                end = min(size, pos + meta_left)
+                meta += view[pos:end]
+                meta_left -= end - pos
+                pos = end
+                if meta_left == 0:
+                    title = parse_stream_title(bytes(meta))
+                    if title is not None:
+                        on_title(title)
+                    meta.clear()
+                    meta_left, audio_left = -1, metaint
+
+
+async def tcp_stream(url: str, media_type: str = "audio/mpeg",
+                     on_title: Optional[Callable[[str], None]] = None,
+                     fallbacks: Sequence[str] = (),
+                     preconnected: Optional[UpstreamResponse] = None):
+    """Raw TCP/TLS reader for ICY, HTTP/1.0 and plain HTTP(S) radio streams.
+
+    With `on_title`, ICY metadata is requested on the same connection and
+    each new StreamTitle is passed to it; listeners still get clean audio.
+    `fallbacks` are tried in order when `url` cannot be connected to or
+    answers with an error status (the alternate URLs of a deduplicated
+    station). `preconnected` is an already open upstream for `url`, handed
+    over from Preconnects.
+    """
+    upstream = None
+    try:
+        candidates = [url, *fallbacks]
+        for attempt, candidate in enumerate(candidates, 1):
+            try:
+                if preconnected is not None:
+                    upstream, preconnected = preconnected, None
+                else:
+                    upstream = await open_upstream(candidate, icy_metadata=on_title is not None)
+            except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+                if attempt == len(candidates): raise
+                log.debug("Upstream failed (%.80s), trying an alternate: %s", candidate, e)
+                continue
+            if upstream.status >= 400 and attempt < len(candidates):
+                log.debug("Upstream refused (%.80s): %s, trying an alternate", candidate, upstream.status_line)
+                await upstream.close()
+                upstream = None
+                continue
+            break
+        ct = upstream.headers.get("content-type", "n/a")
+        metaint = upstream.headers.get("icy-metaint", "")
+        log.debug("TCP proxy upstream: %s | content-type: %s | proxied as: %s | icy-metaint: %s",
+                  upstream.status_line, ct, media_type, metaint or "-")
+
+        reader = upstream.reader
+        if on_title is not None and metaint.isdigit() and int(metaint) > 0:
+            async for chunk in _demux_icy(reader, int(metaint), on_title):
+                yield chunk
+            return
+
+        # No inline metadata: just pipe the raw audio data
+        while True:
+            chunk = await reader.read(PROXY_CHUNK_SIZE)
+            if not chunk: break
+            yield chunk
+
+    except Exception as e:
+        # Swallowed so the hub ends cleanly; it never sees these
+        UPSTREAM_ERRORS.labels("tcp", type(e).__name__).inc()
+        log.warning("Proxy upstream error (%.80s): %s", url, e)
+    finally:
+        if upstream:
+            await upstream.close()
+        if preconnected:
+            await preconnected.close()
+
+
+class Preconnects:
+    """Upstream connections opened ahead of their first listener, by hub key.
+
+    `start()` opens a station's upstream in the background exactly as
+    tcp_stream would (headers read, ICY metadata requested) and parks it.
+    `take()` hands it to the /api/proxy request that follows, waiting for
+    one still connecting. Parked connections are closed after `ttl`
+    seconds: the upstream keeps sending meanwhile and the socket buffer
+    fills with audio that is only getting staler.
+    """
+
+    def __init__(self, ttl: float = PRECONNECT_TTL, max_parked: int = PRECONNECT_MAX):
+        self.ttl = ttl
+        self.max_parked = max_parked
+        self._parked: Dict[str, asyncio.Task] = {}     # key -> task resolving to an UpstreamResponse or None
+
+        self.started = 0
+        self.claimed = 0
+        self.expired = 0
+        self.failed = 0
+
+    def start(self, key: str, url: str) -> bool:
+        """Begin pre-connecting `url` unless it already is (or too many are parked)."""
+        if key in self._parked or len(self._parked) >= self.max_parked:
+            return False
+        self.started += 1
+        task = asyncio.get_running_loop().create_task(self._open(key, url))
+        self._parked[key] = task
+        return True
+
+    async def _open(self, key: str, url: str) -> Optional[UpstreamResponse]:
+        this = asyncio.current_task()
+        try:
+            upstream = await asyncio.wait_for(open_upstream(url, icy_metadata=True), self.ttl)
+        except Exception as e:
+            upstream = None
+            log.debug("Pre-connect failed (%.80s): %s", url, e)
+        if upstream is not None and upstream.status >= 400:
+            log.debug("Pre-connect refused (%.80s): %s", url, upstream.status_line)
+            await upstream.close()
+            upstream = None
+        if upstream is None:
+            self.failed += 1
+            if self._parked.get(key) is this:
+                del self._parked[key]
+            return None
+        asyncio.get_running_loop().call_later(self.ttl, self._expire, key, this)
+        return upstream
+
+    def _expire(self, key: str, task: asyncio.Task):
+        if self._parked.get(key) is not task:
+            return      # already claimed
+        del self._parked[key]
+        self.expired += 1
+        task.result().writer.close()
+
+    async def take(self, key: str) -> Optional[UpstreamResponse]:
+        """The parked upstream for `key`, if any; the caller must close it or hand it on."""
+        task = self._parked.pop(key, None)
+        if task is None:
+            return None
+        try:
+            upstream = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # The listener left while it was still connecting: nobody will own it
+            task.add_done_callback(self._discard)
+            raise
+        if upstream is not None:
+            self.claimed += 1
+        return upstream
+
+    @staticmethod
+    def _discard(task: asyncio.Task):
+        if not task.cancelled() and task.result() is not None:
+            task.result().writer.close()
+
+    def stats(self) -> Dict:
+        return {
+            "parked": len(self._parked),
+            "started": self.started,
+            "claimed": self.claimed,
+            "expired": self.expired,
+            "failed": self.failed,
+        }
+
+
+preconnects = Preconnects()
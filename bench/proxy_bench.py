@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""Throughput and latency benchmark for /api/proxy against local stand-in upstreams.
+
+Nothing here touches the network: the upstreams are
+
+  * icy    — a Shoutcast-style ICY / HTTP-1.0 server (with icy-metaint)
+  * https  — the same server behind TLS with a throwaway self-signed cert
+  * ytdlp  — a fake `yt-dlp` executable that writes MPEG-TS packets
+
+and the app runs under uvicorn in a child process pointed at a scratch
+database. For each upstream kind, listener count and mode ("same": every
+listener tunes the same station and shares one hub; "distinct": one station
+per listener) it records time to first byte, sustained MB/s per stream and
+the server's CPU time, and writes everything as JSON.
+
+    python bench/proxy_bench.py --listeners 1,100,1000 --output bench.json
+    PROXY_CHUNK_SIZE=16384 python bench/proxy_bench.py --kinds icy --output 16k.json
+
+Upstreams send as fast as they can unless --bitrate is given; use
+--bitrate 128 for a realistic CPU-per-listener figure.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import signal
+import socket
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+METAINT = 16000
+UPSTREAM_CHUNK = 8192
+# Longer than StreamHub.GRACE_SECONDS plus StreamProcessManager.KILL_TIMEOUT,
+# so one scenario's upstreams are closed (and not burning CPU, or holding
+# yt-dlp slots) before the next starts
+SETTLE_SECONDS = 14.0
+
+FAKE_YTDLP = """#!{python}
+import os, sys, time
+# One MPEG-TS packet: sync byte + payload; the proxy never looks inside
+packet = b"\\x47" + b"\\x00" * 187
+burst = packet * 44
+bitrate = int(os.getenv("FAKE_YTDLP_BITRATE", "0")) * 1000 // 8
+out = sys.stdout.buffer
+try:
+    while True:
+        out.write(burst)
+        out.flush()
+        if bitrate:
+            time.sleep(len(burst) / bitrate)
+except (BrokenPipeError, KeyboardInterrupt):
+    pass
+"""
+
+
+# ── STAND-IN UPSTREAMS (run in their own process) ───────────────────────────
+
+async def _icy_handler(reader, writer, bitrate: int):
+    try:
+        request = await reader.readuntil(b"\r\n\r\n")
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        writer.close()
+        return
+    metadata = b"icy-metadata: 1" in request.lower()
+    writer.write(
+        b"ICY 200 OK\r\ncontent-type: audio/mpeg\r\nicy-name: bench\r\n"
+        + (b"icy-metaint: %d\r\n" % METAINT if metadata else b"")
+        + b"\r\n"
+    )
+    audio = b"\xff\xfb" * (METAINT // 2)
+    title = b"StreamTitle='Bench - Track';"
+    title += b"\0" * (-len(title) % 16)
+    block = audio + (bytes([len(title) // 16]) + title if metadata else b"")
+    try:
+        # The proxy sends nothing after its request, so EOF means it hung up
+        while not reader.at_eof():
+            for i in range(0, len(block), UPSTREAM_CHUNK):
+                writer.write(block[i:i + UPSTREAM_CHUNK])
+                await writer.drain()
+            if bitrate:
+                await asyncio.sleep(len(audio) / bitrate)
+    except (ConnectionError, OSError):
+        pass
+    finally:
+        writer.close()
+
+
+async def _serve_upstreams(icy_port: int, https_port: int, cert: Optional[str], key: Optional[str], bitrate: int):
+    def handler(reader, writer):
+        return _icy_handler(reader, writer, bitrate)
+
+    servers = [await asyncio.start_server(handler, "127.0.0.1", icy_port, backlog=4096)]
+    if cert:
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(cert, key)
+        servers.append(await asyncio.start_server(handler, "127.0.0.1", https_port, ssl=context, backlog=4096))
+    await asyncio.gather(*(s.serve_forever() for s in servers))
+
+
+# ── HARNESS ──────────────────────────────────────────────────────────────────
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _raise_fd_limit(wanted: int):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+    if soft < target:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+
+def _self_signed_cert(workdir: str):
+    """(cert, key) paths for CN=localhost, or (None, None) without openssl."""
+    if shutil.which("openssl") is None:
+        return None, None
+    cert, key = os.path.join(workdir, "cert.pem"), os.path.join(workdir, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1",
+         "-keyout", key, "-out", cert],
+        check=True, capture_output=True,
+    )
+    return cert, key
+
+
+def _cpu_seconds(pid: int) -> Optional[float]:
+    """utime + stime of a live process (and its reaped children) from /proc, Linux only."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    ticks = os.sysconf("SC_CLK_TCK")
+    # fields[11:15] = utime, stime, cutime, cstime (stat fields 14-17)
+    return sum(int(v) for v in fields[11:15]) / ticks
+
+
+def _children_cpu_seconds(pid: int) -> float:
+    """CPU of live child processes (the fake yt-dlp instances) of `pid`."""
+    total = 0.0
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(c) for c in f.read().split()]
+    except OSError:
+        return 0.0
+    for child in children:
+        total += _cpu_seconds(child) or 0.0
+    return total
+
+
+def _wait_for_port(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"nothing listening on port {port} after {timeout}s")
+
+
+def _station_urls(kind: str, listeners: int, mode: str, icy_port: int, https_port: int) -> List[str]:
+    count = 1 if mode == "same" else listeners
+    # Station names are unique per scenario, so no scenario can join a hub
+    # left over from the previous one
+    names = [f"{mode}{listeners}-{i}" for i in range(count)]
+    if kind == "icy":
+        urls = [f"http://127.0.0.1:{icy_port}/stream/{name}" for name in names]
+    elif kind == "https":
+        urls = [f"https://localhost:{https_port}/stream/{name}" for name in names]
+    else:
+        # The fake yt-dlp plays a live stream: only /live/ URLs share a hub
+        urls = [f"https://www.youtube.com/live/{name}" for name in names]
+    return [urls[i % count] for i in range(listeners)]
+
+
+async def _listener(port: int, url: str, duration: float, started: asyncio.Event) -> Dict:
+    """One raw HTTP client on /api/proxy; counts body bytes for `duration` seconds."""
+    result = {"status": None, "ttfb": None, "bytes": 0, "seconds": 0.0, "error": None}
+    await started.wait()
+    t0 = time.monotonic()
+    writer = None
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port, limit=1 << 20)
+        path = "/api/proxy?url=" + url.replace("&", "%26").replace("?", "%3F")
+        # HTTP/1.0: the body comes back close-delimited, not chunked, so an
+        # upstream that dies after the headers shows up as an empty body
+        writer.write(f"GET {path} HTTP/1.0\r\nHost: bench\r\n\r\n".encode())
+        await writer.drain()
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 30)
+        result["status"] = int(head.split(b" ", 2)[1])
+        if result["status"] != 200:
+            return result
+        first = await asyncio.wait_for(reader.read(65536), 30)
+        if not first:
+            return result
+        body_started = time.monotonic()
+        result["ttfb"] = body_started - t0
+        received = len(first)
+        deadline = body_started + duration
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                chunk = await asyncio.wait_for(reader.read(1 << 20), remaining)
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                break
+            received += len(chunk)
+        result["bytes"] = received
+        result["seconds"] = time.monotonic() - body_started
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        if writer is not None:
+            writer.close()
+    return result
+
+
+def _percentiles(values: List[float]) -> Optional[Dict]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {
+        "min": round(ordered[0], 4),
+        "p50": round(statistics.median(ordered), 4),
+        "p95": round(pick(0.95), 4),
+        "max": round(ordered[-1], 4),
+    }
+
+
+async def _run_scenario(port: int, server_pid: int, kind: str, mode: str, listeners: int,
+                        duration: float, icy_port: int, https_port: int) -> Dict:
+    urls = _station_urls(kind, listeners, mode, icy_port, https_port)
+    started = asyncio.Event()
+    tasks = [asyncio.ensure_future(_listener(port, url, duration, started)) for url in urls]
+    cpu_before = _cpu_seconds(server_pid)
+    wall_before = time.monotonic()
+    started.set()
+    results = await asyncio.gather(*tasks)
+    wall = time.monotonic() - wall_before
+    cpu_after = _cpu_seconds(server_pid)
+    # Live yt-dlp children are still running; reaped ones are already in cutime
+    children_cpu = _children_cpu_seconds(server_pid)
+
+    ok = [r for r in results if r["ttfb"] is not None]
+    errors: Dict[str, int] = {}
+    for r in results:
+        if r["ttfb"] is None:
+            reason = r["error"] or f"HTTP {r['status']}" + (", empty body" if r["status"] == 200 else "")
+            errors[reason] = errors.get(reason, 0) + 1
+    mbps = [r["bytes"] / r["seconds"] / 1e6 for r in ok if r["seconds"] > 0]
+    server_cpu = None
+    if cpu_before is not None and cpu_after is not None:
+        server_cpu = round(cpu_after - cpu_before + children_cpu, 3)
+    return {
+        "kind": kind,
+        "mode": mode,
+        "listeners": listeners,
+        "stations": len(set(urls)),
+        "ok": len(ok),
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "ttfb_ms": _percentiles([r["ttfb"] * 1000 for r in ok]),
+        "mb_per_s_per_stream": _percentiles(mbps),
+        "aggregate_mb_per_s": round(sum(r["bytes"] for r in ok) / wall / 1e6, 3) if wall else None,
+        "server_cpu_seconds": server_cpu,
+        "server_cpu_percent": round(100 * server_cpu / wall, 1) if server_cpu is not None else None,
+        "cpu_ms_per_stream_second": (
+            round(1000 * server_cpu / sum(r["seconds"] for r in ok), 4)
+            if server_cpu is not None and ok else None
+        ),
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _mark_sources_fresh(database: str):
+    """Record every source as just refreshed so the scheduler leaves the network alone."""
+    env = dict(os.environ, DATABASE_PATH=database)
+    code = (
+        "from app.database import record_source_refresh\n"
+        "from app.ingestion import discover_parsers\n"
+        "for p in discover_parsers(): record_source_refresh(p.source_name, 'ok')\n"
+    )
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True, capture_output=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--listeners", default="1,100,1000", help="comma-separated listener counts")
+    parser.add_argument("--kinds", default="icy,https,ytdlp", help="upstreams to test: icy, https, ytdlp")
+    parser.add_argument("--modes", default="same,distinct", help="same: one shared station; distinct: one each")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds each listener reads")
+    parser.add_argument("--bitrate", type=int, default=0, help="upstream kbit/s, 0 = as fast as possible")
+    parser.add_argument("--max-processes", type=int, default=8, help="MAX_STREAM_PROCESSES for the app")
+    parser.add_argument("--output", help="write JSON results here (default: stdout)")
+    parser.add_argument("--server-log", help="write the app's and upstreams' output here (default: discard)")
+    parser.add_argument("--serve-upstreams", nargs=5, metavar=("ICY_PORT", "HTTPS_PORT", "CERT", "KEY", "BITRATE"),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_upstreams:
+        icy_port, https_port, cert, key, bitrate = args.serve_upstreams
+        try:
+            asyncio.run(_serve_upstreams(int(icy_port), int(https_port), cert if cert != "-" else None,
+                                         key if key != "-" else None, int(bitrate) * 1000 // 8))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    listener_counts = [int(n) for n in args.listeners.split(",")]
+    kinds = [k.strip() for k in args.kinds.split(",")]
+    modes = [m.strip() for m in args.modes.split(",")]
+    # Clients, app and upstreams each hold a socket per listener
+    _raise_fd_limit(4 * max(listener_counts) + 256)
+
+    workdir = tempfile.mkdtemp(prefix="proxy-bench-")
+    processes: List[subprocess.Popen] = []
+    server_log = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+    try:
+        cert, key = _self_signed_cert(workdir) if "https" in kinds else (None, None)
+        if "https" in kinds and cert is None:
+            print("openssl not found, skipping the https upstream", file=sys.stderr)
+            kinds.remove("https")
+
+        ytdlp = os.path.join(workdir, "yt-dlp")
+        with open(ytdlp, "w") as f:
+            f.write(FAKE_YTDLP.format(python=sys.executable))
+        os.chmod(ytdlp, 0o755)
+
+        icy_port, https_port, app_port = _free_port(), _free_port(), _free_port()
+        processes.append(subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--serve-upstreams",
+             str(icy_port), str(https_port), cert or "-", key or "-", str(args.bitrate)],
+            stdout=server_log, stderr=server_log,
+        ))
+
+        database = os.path.join(workdir, "stations.db")
+        _mark_sources_fresh(database)
+        app_env = dict(
+            os.environ,
+            DATABASE_PATH=database,
+            METADATA_CACHE_DIR=os.path.join(workdir, "metadata-cache"),
+            YTDLP_BINARY=ytdlp,
+            FAKE_YTDLP_BITRATE=str(args.bitrate),
+            MAX_STREAM_PROCESSES=str(args.max_processes),
+            HEALTH_PROBES="0",
+        )
+        if cert:
+            # Trust the throwaway cert for the https upstream only
+            app_env["SSL_CERT_FILE"] = cert
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+             "--port", str(app_port), "--log-level", "warning", "--no-access-log",
+             "--backlog", "4096"],
+            cwd=ROOT, env=app_env, stdout=server_log, stderr=server_log,
+        )
+        processes.append(server)
+        _wait_for_port(icy_port)
+        _wait_for_port(app_port)
+
+        report = {
+            "started_at": time.time(),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "config": {
+                "duration": args.duration,
+                "bitrate_kbps": args.bitrate,
+                "proxy_chunk_size": int(os.getenv("PROXY_CHUNK_SIZE", "4096")),
+                "max_stream_processes": args.max_processes,
+            },
+            "scenarios": [],
+        }
+        for kind in kinds:
+            for mode in modes:
+                for listeners in listener_counts:
+                    if mode == "distinct" and listeners == 1:
+                        continue    # identical to "same" with one listener
+                    scenario = asyncio.run(_run_scenario(
+                        app_port, server.pid, kind, mode, listeners, args.duration, icy_port, https_port,
+                    ))
+                    report["scenarios"].append(scenario)
+                    ttfb = scenario["ttfb_ms"] or {}
+                    rate = scenario["mb_per_s_per_stream"] or {}
+                    print(f"{kind:5} {mode:8} {listeners:5} listeners: {scenario['ok']} ok, "
+                          f"ttfb p50 {ttfb.get('p50')} ms, {rate.get('p50')} MB/s/stream, "
+                          f"cpu {scenario['server_cpu_percent']}%", file=sys.stderr)
+                    time.sleep(SETTLE_SECONDS)
+
+        output = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(output + "\n")
+        else:
+            print(output)
+    finally:
+        for process in processes:
+            process.send_signal(signal.SIGINT)
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if args.server_log:
+            server_log.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""Cold-start benchmark: import time of app.main and time to the first /api/stations response.
+
+Both are measured in fresh child processes against a scratch database seeded
+with synthetic stations (and every source marked fresh, so nothing touches
+the network):
+
+  * import   — `python -X importtime -c "import app.main"`: total import
+               time, the slowest top-level imports, and whether heavy
+               modules (yt_dlp, httpx) were pulled in eagerly
+  * startup  — uvicorn is started and /api/stations polled until it answers
+               200; the time from spawn to that response
+
+    python bench/startup_bench.py --stations 20000 --output startup.json
+    python bench/startup_bench.py --max-import-ms 800 --max-first-response-ms 3000
+
+With --max-* thresholds the script exits non-zero when the median run is
+over budget, so it can guard against import-time regressions in CI.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Modules that must not be imported just by loading the app
+LAZY_MODULES = ("yt_dlp", "httpx")
+
+SEED_CODE = """
+import random, sys
+from app.database import upsert_stations, record_source_refresh
+from app.ingestion import discover_parsers
+rng = random.Random(0)
+rows = [
+    {"uuid": f"bench-{i}", "name": f"Bench Station {i}", "url": f"http://127.0.0.1:9/{i}",
+     "country": "Benchland", "tags": "bench,test", "lat": rng.uniform(-80, 80),
+     "lng": rng.uniform(-180, 180), "source": "bench"}
+    for i in range(int(sys.argv[1]))
+]
+for start in range(0, len(rows), 1000):
+    upsert_stations(rows[start:start + 1000])
+for p in discover_parsers(): record_source_refresh(p.source_name, "ok")
+"""
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _parse_importtime(stderr: str) -> Dict:
+    """Cumulative microseconds per module from `-X importtime` output."""
+    cumulative: Dict[str, int] = {}
+    top_level: Dict[str, int] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cum, name = line[len("import time:"):].split("|")
+        cum = cum.strip()
+        if not cum.isdigit():
+            continue    # the header line
+        cumulative[name.strip()] = int(cum)
+        # Nesting is shown by indentation past the one separating space
+        if not name[1:].startswith(" "):
+            top_level[name.strip()] = int(cum)
+    return {"cumulative": cumulative, "top_level": top_level}
+
+
+def measure_import(env: Dict) -> Dict:
+    started = time.monotonic()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"],
+                          cwd=ROOT, env=env, capture_output=True, text=True)
+    wall = time.monotonic() - started
+    if proc.returncode != 0:
+        raise RuntimeError(f"import app.main failed:\n{proc.stderr[-2000:]}")
+    parsed = _parse_importtime(proc.stderr)
+    slowest = sorted(parsed["top_level"].items(), key=lambda kv: kv[1], reverse=True)[:10]
+    return {
+        "app_main_ms": round(parsed["cumulative"].get("app.main", 0) / 1000, 1),
+        "process_wall_ms": round(wall * 1000, 1),
+        "slowest_top_level_ms": {name: round(us / 1000, 1) for name, us in slowest},
+        "eager_heavy_imports": [m for m in LAZY_MODULES if m in parsed["cumulative"]],
+    }
+
+
+def _get_status(port: int, path: str) -> Optional[int]:
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=1.0) as s:
+            s.sendall(f"GET {path} HTTP/1.0\r\nHost: bench\r\n\r\n".encode())
+            head = s.recv(64)
+            return int(head.split(b" ", 2)[1])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def measure_first_response(env: Dict, timeout: float, log) -> Dict:
+    port = _free_port()
+    started = time.monotonic()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning", "--no-access-log"],
+        cwd=ROOT, env=env, stdout=log, stderr=log,
+    )
+    try:
+        deadline = started + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise RuntimeError(f"server exited with {server.returncode}")
+            if _get_status(port, "/api/stations") == 200:
+                return {"first_response_ms": round((time.monotonic() - started) * 1000, 1)}
+            time.sleep(0.01)
+        raise RuntimeError(f"no 200 from /api/stations after {timeout}s")
+    finally:
+        server.send_signal(signal.SIGINT)
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, default=5000, help="synthetic stations seeded into the scratch DB")
+    parser.add_argument("--runs", type=int, default=5, help="repetitions; medians are reported")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for the first response")
+    parser.add_argument("--max-import-ms", type=float, help="fail if the median app.main import is slower")
+    parser.add_argument("--max-first-response-ms", type=float, help="fail if the median first response is slower")
+    parser.add_argument("--output", help="write JSON results here (default: stdout)")
+    parser.add_argument("--server-log", help="write the app's output here (default: discard)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="startup-bench-")
+    server_log = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+    try:
+        env = dict(
+            os.environ,
+            DATABASE_PATH=os.path.join(workdir, "stations.db"),
+            METADATA_CACHE_DIR=os.path.join(workdir, "metadata-cache"),
+            HEALTH_PROBES="0",
+        )
+        subprocess.run([sys.executable, "-c", SEED_CODE, str(args.stations)],
+                       cwd=ROOT, env=env, check=True, capture_output=True)
+
+        imports = [measure_import(env) for _ in range(args.runs)]
+        responses = [measure_first_response(env, args.timeout, server_log) for _ in range(args.runs)]
+
+        import_ms = statistics.median(r["app_main_ms"] for r in imports)
+        first_ms = statistics.median(r["first_response_ms"] for r in responses)
+        report = {
+            "started_at": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "stations": args.stations,
+            "runs": args.runs,
+            "import_ms_median": import_ms,
+            "first_response_ms_median": first_ms,
+            "eager_heavy_imports": imports[0]["eager_heavy_imports"],
+            "slowest_top_level_ms": imports[0]["slowest_top_level_ms"],
+            "import_runs": [r["app_main_ms"] for r in imports],
+            "first_response_runs": [r["first_response_ms"] for r in responses],
+        }
+        output = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(output + "\n")
+        else:
+            print(output)
+
+        failures: List[str] = []
+        if args.max_import_ms is not None and import_ms > args.max_import_ms:
+            failures.append(f"import app.main {import_ms} ms > {args.max_import_ms} ms")
+        if args.max_first_response_ms is not None and first_ms > args.max_first_response_ms:
+            failures.append(f"first /api/stations response {first_ms} ms > {args.max_first_response_ms} ms")
+        if report["eager_heavy_imports"]:
+            failures.append(f"imported eagerly: {', '.join(report['eager_heavy_imports'])}")
+        for failure in failures:
+            print(f"REGRESSION: {failure}", file=sys.stderr)
+        sys.exit(1 if failures else 0)
+    finally:
+        if args.server_log:
+            server_log.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import asyncio
+import json
+
+import pytest
+
+from app.parsers import iter_json_array
+
+DOCUMENT = '[1234, 5, -0.25e3, "café", true, null, {"a": [10, 20]}, [], 99]'
+
+
+def _decode(data: bytes, chunk_size: int):
+    async def chunks():
+        for i in range(0, len(data), chunk_size):
+            yield data[i:i + chunk_size]
+
+    async def collect():
+        return [item async for item in iter_json_array(chunks())]
+
+    return asyncio.run(collect())
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 7, 1024])
+def test_elements_split_across_chunks(chunk_size):
+    data = DOCUMENT.encode()
+    assert _decode(data, chunk_size) == json.loads(DOCUMENT)
+
+
+def test_number_split_in_two_byte_chunks():
+    assert _decode(b"[1234, 5]", 2) == [1234, 5]
+
+
+@pytest.mark.parametrize("data", [b"[1, 2", b"[1234", b'{"a": 1}'])
+def test_malformed_array(data):
+    with pytest.raises(ValueError):
+        _decode(data, 2)